@@ -27,17 +27,23 @@ if "bpy" in locals():
     import importlib
     if "importer" in locals():
         importlib.reload(importer)
+    if "inspector" in locals():
+        importlib.reload(inspector)
 else:
     from . import importer
+    from . import inspector
 
 
 
 import bpy
 import os
+import time
 from bpy.props import (
         BoolProperty,
+        CollectionProperty,
         EnumProperty,
         FloatProperty,
+        IntProperty,
         StringProperty,
         )
 from bpy_extras.io_utils import (
@@ -48,6 +54,12 @@ from bpy_extras.io_utils import (
 
 
 
+class GTAComponent(bpy.types.PropertyGroup):
+    path: StringProperty()
+    use: BoolProperty(name="import", default=True)
+    description: StringProperty()
+
+
 class ImportGTA(bpy.types.Operator, ImportHelper):
 
     bl_idname = "import_scene.gta"
@@ -60,6 +72,10 @@ class ImportGTA(bpy.types.Operator, ImportHelper):
             options={'HIDDEN'}
             )
 
+    files: CollectionProperty(type=bpy.types.OperatorFileListElement, options={'HIDDEN', 'SKIP_SAVE'})
+
+    directory: StringProperty(subtype='DIR_PATH', options={'HIDDEN', 'SKIP_SAVE'})
+
     import_armature: EnumProperty(
         name="import armature",
         description="Auto will use existing armature or create new one. Selecting the armature before importing the mesh, can solve name conflicts.",
@@ -110,26 +126,346 @@ class ImportGTA(bpy.types.Operator, ImportHelper):
         options=set()
     )
 
+    max_influences: IntProperty(
+        name="max influences",
+        description="Keep only the strongest bone weights per vertex, 0 keeps all",
+        default=0,
+        min=0,
+        max=8,
+        options=set()
+    )
+
+    normalize_weights: BoolProperty(
+        name="normalize weights",
+        description="Scale the bone weights of every vertex to sum up to 1",
+        default=False,
+        options=set()
+    )
+
+    parser_engine: EnumProperty(
+        name="parser",
+        description="Fast tokenizes the whole file buffer at once, legacy is the original line parser",
+        items=[
+            ("fast", "fast", "iterative buffer tokenizer", 1),
+            ("legacy", "legacy", "recursive line parser", 2),
+        ],
+        default="fast",
+        options=set()
+    )
+
+    weld_vertices: BoolProperty(
+        name="weld vertices",
+        description="Merge vertices at the same position (and with the same skin weights), "
+                    "uvs, colors and normals are kept per face corner",
+        default=False,
+        options=set()
+    )
+
+    unique_meshes: BoolProperty(
+        name="unique meshes",
+        description="Build new mesh data for every reference to a .mesh file, "
+                    "otherwise repeated references share the mesh data of the first one",
+        default=False,
+        options=set()
+    )
+
+    parse_workers: IntProperty(
+        name="parse workers",
+        description="Parse the components of .odd files in this many background processes "
+                    "while the previous components are built, 0 parses them one by one",
+        default=0,
+        min=0,
+        max=32,
+        options=set()
+    )
+
+    cache_folder: StringProperty(
+        name="cache folder",
+        description="Keep parsed files in this folder to skip parsing on the next import. "
+                    "Empty uses the GTA_IMPORTER_CACHE environment variable, if set",
+        default="",
+        subtype='DIR_PATH',
+        options=set()
+    )
+
+    cache_size: IntProperty(
+        name="cache size (MB)",
+        description="Least recently used entries are removed above this size",
+        default=2048,
+        min=1,
+        options=set()
+    )
+
+    catalog_file: StringProperty(
+        name="catalog",
+        description="Resolve skeletons, texture folders and textures from this catalog (see catalog.py) "
+                    "instead of searching the disk. Empty uses the GTA_IMPORTER_CATALOG environment variable, if set",
+        default="",
+        subtype='FILE_PATH',
+        options=set()
+    )
+
+    include: StringProperty(
+        name="include",
+        description="Import only .odd components matching these comma separated name patterns (head_*, uppr_000*), "
+                    "empty imports all",
+        default="",
+        options=set()
+    )
+
+    exclude: StringProperty(
+        name="exclude",
+        description="Skip .odd components matching these comma separated name patterns",
+        default="",
+        options=set()
+    )
+
+    components: CollectionProperty(type=GTAComponent, options={'SKIP_SAVE'})
+
+    scanned_file: StringProperty(options={'HIDDEN', 'SKIP_SAVE'})
+
+    progressive_lod: BoolProperty(
+        name="progressive LOD",
+        description="Show the lowest LOD at once and swap in the selected LOD "
+                    "when it has been loaded in the background",
+        default=False,
+        options=set()
+    )
+
+    keep_lods: BoolProperty(
+        name="keep all LODs",
+        description="Load every LOD in the background and keep them as mesh data, "
+                    "switch between them with the Switch GTA LOD operator",
+        default=False,
+        options=set()
+    )
+
+    profile_import: BoolProperty(
+        name="profile import",
+        description="Time every import stage and report the slowest ones, "
+                    "the full table is printed to the console",
+        default=False,
+        options=set()
+    )
+
+    profile_memory: BoolProperty(
+        name="profile memory",
+        description="Also report the peak Python memory of a profiled import, "
+                    "tracing allocations makes the timings of that run slower",
+        default=False,
+        options=set()
+    )
+
+    profile_file: StringProperty(
+        name="profile file",
+        description="Also write the timings as json to this file",
+        default="",
+        subtype='FILE_PATH',
+        options=set()
+    )
+
+    def check(self, context):
+        # fill the component picker when another .odd is selected
+        picker_file = self.getPickerFile()
+        if picker_file == self.scanned_file:
+            return False
+        self.scanned_file = picker_file
+        self.components.clear()
+        if picker_file and os.path.isfile(picker_file):
+            catalog = importer.catalog.getCatalog(bpy.path.abspath(self.catalog_file))
+            for component in inspector.scanComponents(picker_file, catalog):
+                item = self.components.add()
+                item.name = component["name"]
+                item.path = component["path"]
+                item.description = ", ".join("{0} {1}".format(lod, "-" if vertices is None else vertices)
+                                             for lod, vertices in component["lods"].items())
+        return True
+
+    def draw(self, context):
+        layout = self.layout
+        for prop in self.bl_rna.properties:
+            if prop.identifier not in ("rna_type", "components") and not prop.is_hidden:
+                layout.prop(self, prop.identifier)
+        if self.components:
+            box = layout.box()
+            box.label(text="components (vertices per LOD)")
+            for component in self.components:
+                row = box.row()
+                row.prop(component, "use", text=component.name)
+                row.label(text=component.description)
+        elif not self.scanned_file and len([path for path in self.getPaths() if path.lower().endswith(".odd")]) > 1:
+            layout.label(text="select a single .odd to pick its components")
+
+    def getPaths(self):
+        # every file selected in the file browser, or filepath when called from a script
+        paths = [os.path.join(self.directory, file.name) for file in self.files if file.name]
+        return [path for path in paths if path.lower().endswith((".odr", ".odd"))] or [self.filepath]
+
+    def getPickerFile(self):
+        # the picker lists the components of one .odd, with several the choices would apply to all of them
+        odd_paths = [path for path in self.getPaths() if path.lower().endswith(".odd")]
+        return odd_paths[0] if len(odd_paths) == 1 else ""
+
+    def getKeywords(self):
+        keywords = self.as_keywords(ignore=("components", "scanned_file", "files", "directory"))
+        keywords.update(importer.fileKeywords(keywords["filepath"]))
+        # components unticked in the picker are excluded by name
+        if self.components and self.scanned_file and self.scanned_file == self.getPickerFile():
+            keywords["exclude"] = importer.getPatterns(self.exclude) + [
+                component.name.lower() for component in self.components if not component.use]
+        return keywords
+
+    def execute(self, context):
+        keywords = self.getKeywords()
+        del keywords["filepath"]
+        return importer.loadFiles(self, context, self.getPaths(), **keywords)
+
+
+class ImportGTAModal(ImportGTA):
+    """Import in small steps from a timer, the interface keeps drawing and Esc cancels the import"""
+
+    bl_idname = "import_scene.gta_modal"
+    bl_label = 'Import mesh (time-sliced)'
+
+    # seconds of import work per timer event. Files are parsed on a thread
+    # (importer.readFileSteps) and worker results are polled, so waiting on
+    # a parse does not block a step. Building a large mesh still can.
+    budget = 0.03
+    # events still handled by Blender while the import runs
+    passed_events = {'MIDDLEMOUSE', 'WHEELUPMOUSE', 'WHEELDOWNMOUSE', 'MOUSEMOVE', 'INBETWEEN_MOUSEMOVE',
+                     'TRACKPADPAN', 'TRACKPADZOOM', 'MOUSEROTATE', 'NDOF_MOTION'}
+
+    def execute(self, context):
+        if bpy.app.background or context.window is None:
+            return super().execute(context)
+        keywords = self.getKeywords()
+        del keywords["filepath"]
+        paths = self.getPaths()
+        self.model_name = keywords["name"] if len(paths) == 1 else "{0} files".format(len(paths))
+        self.before = importer.getDatablocks()
+        self.steps = importer.loadFilesSteps(self, context, paths, **keywords)
+        self.step = ""
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(0.01, window=context.window)
+        wm.modal_handler_add(self)
+        wm.progress_begin(0, 100)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            return self.cancelImport(context, "import cancelled")
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'} if event.type in self.passed_events else {'RUNNING_MODAL'}
+
+        deadline = time.perf_counter() + self.budget
+        try:
+            while time.perf_counter() < deadline:
+                self.step = next(self.steps)
+        except StopIteration as stop:
+            self.finish(context)
+            return stop.value
+        except Exception as error:
+            print("import failed: {0}".format(error))
+            return self.cancelImport(context, "import failed: {0}".format(error))
+
+        done, total = importer.progress
+        context.window_manager.progress_update(100 * done // total if total else 0)
+        context.workspace.status_text_set("Importing {0}: {1}/{2} components, {3} (Esc to cancel)".format(
+            self.model_name, done, total, self.step))
+        return {'RUNNING_MODAL'}
+
+    def cancelImport(self, context, message):
+        # the generator's cleanup runs first, then everything it created is removed
+        self.steps.close()
+        removed = importer.removeDatablocks(self.before)
+        self.finish(context)
+        self.report({'WARNING'}, "{0}, removed {1} new datablocks".format(message, removed))
+        return {'CANCELLED'}
+
+    def finish(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+
+class SwitchGTALOD(bpy.types.Operator):
+    """Show another LOD of the selected imported models"""
+
+    bl_idname = "object.gta_switch_lod"
+    bl_label = "Switch GTA LOD"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    LOD: EnumProperty(
+        name="LOD",
+        items=[
+            ("High", "High", "High", 1),
+            ("Med", "Med", "Med", 2),
+            ("Low", "Low", "Low", 3),
+            ("Vlow", "Vlow", "Vlow", 4),
+        ],
+        default="High",
+    )
+
+    @classmethod
+    def poll(cls, context):
+        return any(importer.lods.PROPERTY in obj for obj in context.selected_objects)
+
+    def execute(self, context):
+        switched = 0
+        for obj in context.selected_objects:
+            if importer.lods.PROPERTY in obj and importer.lods.showLOD(obj, self.LOD):
+                switched += 1
+        if not switched:
+            self.report({'WARNING'}, "no {0} LOD loaded for the selected objects".format(self.LOD))
+            return {'CANCELLED'}
+        return {'FINISHED'}
+
+class RefreshGTAModel(bpy.types.Operator):
+    """Rebuild the meshes, materials and armatures of the selected imported models whose source files changed"""
+
+    bl_idname = "object.gta_refresh"
+    bl_label = "Refresh GTA Model"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        return context.mode == 'OBJECT' and any(
+            importer.sources.PROPERTY in obj or (obj.parent and importer.sources.PROPERTY in obj.parent)
+            for obj in context.selected_objects)
+
     def execute(self, context):
-        keywords = self.as_keywords()
-        keywords["name"] = os.path.basename(keywords["filepath"]).split(".")[0]
-        keywords["file_extension"] = os.path.basename(keywords["filepath"]).split(".")[1]
-        keywords["folder"] = os.path.dirname(keywords["filepath"])
-        return importer.load(self, context, **keywords)
+        return importer.refresh(self, context, context.selected_objects)
 
 # Add to a menu
 def menu_func_import(self, context):
     self.layout.operator(ImportGTA.bl_idname, text="GTA V Model (.odr/.odd)")
+    self.layout.operator(ImportGTAModal.bl_idname, text="GTA V Model, time-sliced (.odr/.odd)")
 
 
 def register():
+    bpy.utils.register_class(GTAComponent)
     bpy.utils.register_class(ImportGTA)
+    bpy.utils.register_class(ImportGTAModal)
+    bpy.utils.register_class(SwitchGTALOD)
+    bpy.utils.register_class(RefreshGTAModel)
     bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
+    bpy.app.handlers.load_post.append(importer.skeletons.onLoadPost)
+    bpy.app.handlers.load_post.append(importer.materials.onLoadPost)
+    bpy.app.handlers.load_post.append(importer.instances.onLoadPost)
+    bpy.app.handlers.load_post.append(importer.lods.onLoadPost)
 
 
 def unregister():
     bpy.utils.unregister_class(ImportGTA)
+    bpy.utils.unregister_class(ImportGTAModal)
+    bpy.utils.unregister_class(SwitchGTALOD)
+    bpy.utils.unregister_class(RefreshGTAModel)
+    bpy.utils.unregister_class(GTAComponent)
     bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
+    bpy.app.handlers.load_post.remove(importer.skeletons.onLoadPost)
+    bpy.app.handlers.load_post.remove(importer.materials.onLoadPost)
+    bpy.app.handlers.load_post.remove(importer.instances.onLoadPost)
+    bpy.app.handlers.load_post.remove(importer.lods.onLoadPost)
 
 
 if __name__ == "__main__":
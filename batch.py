@@ -0,0 +1,140 @@
+"""Convert .odd/.odr files to .blend files without the user interface.
+
+    blender --background --python batch.py -- INPUT [INPUT ...] [options]
+
+Inputs can be files, folders or glob patterns ("dumps/**/*.odd"). All
+.mesh/.skel files the inputs reference are parsed in a process pool first,
+then every input is imported into an empty scene and saved as its own
+.blend file. The exit code is 1 if any input failed.
+"""
+
+import argparse
+import glob
+import importlib
+import os
+import sys
+import time
+
+
+def getAddon():
+    # this script runs outside of the addon package, import it by folder name
+    folder = os.path.dirname(os.path.abspath(__file__))
+    parent, name = os.path.split(folder)
+    if parent not in sys.path:
+        sys.path.append(parent)
+    return importlib.import_module(name)
+
+
+def parseArguments(argv):
+    if "--" in argv:
+        argv = argv[argv.index("--") + 1:]
+    else:
+        argv = []
+    parser = argparse.ArgumentParser(prog="blender --background --python batch.py --",
+                                     description="Convert GTA V .odd/.odr models to .blend files.")
+    parser.add_argument("inputs", nargs="+", help="files, folders or glob patterns")
+    parser.add_argument("-o", "--output", default="{dir}/{name}.blend",
+                        help="output path pattern, {dir} and {name} refer to the input (default: %(default)s)")
+    parser.add_argument("-j", "--workers", type=int, default=0,
+                        help="parser processes, 0 uses one per cpu (default: %(default)s)")
+    parser.add_argument("--lod", default="High", choices=["High", "Med", "Low", "Vlow"])
+    parser.add_argument("--texture-format", default=".dds", choices=[".dds", ".png", ".bmp", ".jpeg"])
+    parser.add_argument("--armature", default="auto", choices=["no", "create", "auto"])
+    parser.add_argument("--materials", default="auto", choices=["no", "create", "auto"])
+    parser.add_argument("--parser", default="fast", choices=["fast", "legacy"])
+    parser.add_argument("--weld", action="store_true", help="merge vertices at the same position")
+    parser.add_argument("--cache-folder", default="", help="parse cache folder, see the import operator")
+    parser.add_argument("--catalog", default="", help="resolve paths from this catalog, see catalog.py")
+    parser.add_argument("--include", default="", help="import only .odd components matching these comma separated patterns")
+    parser.add_argument("--exclude", default="", help="skip .odd components matching these comma separated patterns")
+    return parser.parse_args(argv)
+
+
+def expandInputs(inputs):
+    files = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            matches = glob.glob(os.path.join(pattern, "**", "*.odd"), recursive=True)
+            matches += glob.glob(os.path.join(pattern, "**", "*.odr"), recursive=True)
+        else:
+            matches = glob.glob(pattern, recursive=True)
+        for path in sorted(matches):
+            path = os.path.abspath(path)
+            if path.lower().endswith((".odd", ".odr")) and path not in files:
+                files.append(path)
+    return files
+
+
+class BatchOperator:
+    # stands in for the operator that importer.load reports to
+
+    def report(self, type, message):
+        print("  {0}: {1}".format(", ".join(sorted(type)), message))
+
+
+def main():
+    args = parseArguments(sys.argv)
+    addon = getAddon()
+    importer = importlib.import_module(addon.__name__ + ".importer")
+
+    import bpy
+
+    inputs = expandInputs(args.inputs)
+    if not inputs:
+        print("no .odd/.odr files found")
+        return 1
+
+    options = {
+        "import_armature": args.armature,
+        "create_materials": args.materials,
+        "texture_format": args.texture_format,
+        "LOD": args.lod,
+        "parser_engine": args.parser,
+        "cache_folder": args.cache_folder,
+        "catalog_file": args.catalog,
+        "include": args.include,
+        "exclude": args.exclude,
+        "weld_vertices": args.weld,
+    }
+
+    # find and parse everything the inputs reference
+    start = time.perf_counter()
+    dependencies = {}
+    parsed = importer.parseAhead(inputs, dependencies, parse_workers=args.workers, **options)
+    parse_time = time.perf_counter() - start
+    parsed_bytes = sum(parser.stats["bytes"] for parser in parsed.values() if parser)
+    print("parsed {0} files ({1:.1f} MB) in {2:.2f}s".format(len(parsed), parsed_bytes / 1e6, parse_time))
+
+    failures = []
+    build_time = 0.0
+    for filepath in inputs:
+        start = time.perf_counter()
+        keywords = importer.fileKeywords(filepath)
+        output = args.output.format(dir=os.path.dirname(filepath), name=keywords["name"])
+        try:
+            bpy.ops.wm.read_factory_settings(use_empty=True)
+            kwargs = dict(options)
+            kwargs.update(keywords)
+            importer.load(BatchOperator(), bpy.context, filepath=filepath, parsed=parsed, **kwargs)
+            if not any(obj.type == 'MESH' for obj in bpy.data.objects):
+                raise RuntimeError("no mesh imported")
+            os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+            bpy.ops.wm.save_as_mainfile(filepath=output)
+        except Exception as error:
+            failures.append(filepath)
+            print("FAILED {0}: {1}".format(filepath, error))
+            continue
+        seconds = time.perf_counter() - start
+        build_time += seconds
+        print("{0} -> {1} ({2} files, {3:.2f}s)".format(filepath, output, len(dependencies[filepath]), seconds))
+
+    converted = len(inputs) - len(failures)
+    total = parse_time + build_time
+    print("converted {0}/{1} models in {2:.2f}s (parse {3:.2f}s, build {4:.2f}s), {5:.2f} models/s, {6:.1f} MB/s parsed".format(
+        converted, len(inputs), total, parse_time, build_time,
+        converted / total if total else 0.0, parsed_bytes / 1e6 / parse_time if parse_time else 0.0))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""Parser microbenchmarks, run without Blender.
+
+    python benchmarks/bench.py [-o results.json] [--baseline old.json]
+
+Generates a synthetic corpus (see generate.py) unless --corpus points to an
+existing folder, then times file_parser on it. Every benchmark reports the
+best of --repeat runs. Both engines are compared per file type with the
+original parser, a frozen copy of it lives in baseline_parser.py. With
+--baseline, the ratio to an earlier result file is printed for every
+benchmark (> 1.0 is faster).
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import baseline_parser
+import file_parser
+import generate
+
+
+def best(function, repeat):
+    seconds = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+
+def countVertices(parser):
+    vertices = 0
+    for geometry in (parser.getMemberByName("Geometries") or {"members": []})["members"]:
+        vertex_block = file_parser.getChild(geometry, "Vertices")
+        vertices += file_parser.getBlockCount(vertex_block) if vertex_block else 0
+    return vertices
+
+
+def getPayloads(path):
+    # raw Vertices/Indices chunks of a mesh file, as the tokenizer hands them to the decoders
+    payloads = []
+    parser = file_parser.parseFile(path, lazy=True)
+    for geometry in parser.getMemberByName("Geometries")["members"]:
+        for block in geometry["members"]:
+            if isinstance(block, file_parser.LazyBlock):
+                with open(path, "rb") as f:
+                    f.seek(block.start)
+                    payloads.append((block.v_type, f.read(block.end - block.start), geometry.get("VertexDeclaration")))
+    return payloads
+
+
+def benchRead(paths, engine, repeat):
+    size = sum(os.path.getsize(path) for path in paths)
+    vertices = sum(countVertices(file_parser.parseFile(path, engine)) for path in paths)
+    seconds = best(lambda: [file_parser.parseFile(path, engine) for path in paths], repeat)
+    result = {"files": len(paths), "bytes": size, "seconds": seconds, "mb_per_second": size / 1e6 / seconds}
+    if vertices:
+        result.update(vertices=vertices, vertices_per_second=vertices / seconds)
+    return result
+
+
+def benchBaseline(paths, repeat):
+    size = sum(os.path.getsize(path) for path in paths)
+    seconds = best(lambda: [baseline_parser.GTA_Parser().read_file(path) for path in paths], repeat)
+    return {"files": len(paths), "bytes": size, "seconds": seconds, "mb_per_second": size / 1e6 / seconds}
+
+
+def benchMemory(paths, engine):
+    # peak and retained memory per MB of input, see GTA_Parser.read_file for the targets
+    size = sum(os.path.getsize(path) for path in paths)
+    tracemalloc.start()
+    parsers = [file_parser.parseFile(path, engine) for path in paths]
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del parsers
+    return {"bytes": size, "peak": peak, "retained": retained,
+            "peak_per_mb": peak / size, "retained_per_mb": retained / size}
+
+
+def benchLazy(paths, repeat):
+    size = sum(os.path.getsize(path) for path in paths)
+    seconds = best(lambda: [file_parser.parseFile(path, lazy=True) for path in paths], repeat)
+    return {"files": len(paths), "bytes": size, "seconds": seconds, "mb_per_second": size / 1e6 / seconds}
+
+
+def benchLookup(paths, repeat, names=("Geometries", "Skinned", "BoneCount", "LodGroup", "Shaders", "Missing")):
+    parsers = [file_parser.parseFile(path, lazy=True) for path in paths]
+
+    def lookup():
+        for parser in parsers:
+            parser.index = None
+            for name in names:
+                parser.getMemberByName(name)
+
+    def lookupIndexed():
+        for parser in parsers:
+            for name in names:
+                parser.getMemberByName(name)
+
+    lookups = len(parsers) * len(names)
+    cold = best(lookup, repeat)
+    warm = best(lookupIndexed, repeat)
+    return {"lookups": lookups, "seconds_with_index_build": cold, "seconds": warm,
+            "microseconds_per_lookup": warm / lookups * 1e6}
+
+
+def benchDecode(payloads, repeat):
+    vertex_chunks = [(chunk, declaration) for v_type, chunk, declaration in payloads
+                     if v_type == file_parser.ValueType.VERTICES]
+    face_chunks = [chunk for v_type, chunk, declaration in payloads if v_type == file_parser.ValueType.INDICES]
+
+    def decodeVertices():
+        vertices = 0
+        for chunk, declaration in vertex_chunks:
+            member = file_parser.newMember()
+            file_parser.decodeVertices(chunk, member, declaration)
+            vertices += len(member["vertices"])
+        return vertices
+
+    def decodeFaces():
+        indices = 0
+        for chunk in face_chunks:
+            member = file_parser.newMember()
+            file_parser.decodeFaces(chunk, member)
+            indices += member["faces"].size
+        return indices
+
+    vertices = decodeVertices()
+    indices = decodeFaces()
+    vertex_bytes = sum(len(chunk) for chunk, declaration in vertex_chunks)
+    face_bytes = sum(len(chunk) for chunk in face_chunks)
+    vertex_seconds = best(decodeVertices, repeat)
+    face_seconds = best(decodeFaces, repeat)
+    return {
+        "vertices": {"count": vertices, "bytes": vertex_bytes, "seconds": vertex_seconds,
+                     "mb_per_second": vertex_bytes / 1e6 / vertex_seconds,
+                     "vertices_per_second": vertices / vertex_seconds},
+        "indices": {"count": indices, "bytes": face_bytes, "seconds": face_seconds,
+                    "mb_per_second": face_bytes / 1e6 / face_seconds,
+                    "indices_per_second": indices / face_seconds},
+    }
+
+
+def run(corpus, repeat=3):
+    meshes = sorted(glob.glob(os.path.join(corpus, "**", "*.mesh"), recursive=True))
+    models = sorted(glob.glob(os.path.join(corpus, "**", "*.od[dr]"), recursive=True))
+    skeletons = sorted(glob.glob(os.path.join(corpus, "**", "*.skel"), recursive=True))
+    results = {"read_file": {}, "speedup": {}, "memory": {}, "lazy": {}, "lookup": {}, "decode": {}}
+    files = {"mesh": meshes, "skel": skeletons, "model": models}
+    for file_type, paths in files.items():
+        if not paths:
+            continue
+        results["read_file"][file_type + "_baseline"] = benchBaseline(paths, repeat)
+        for engine in file_parser.PARSER_ENGINES:
+            results["read_file"][file_type + "_" + engine] = benchRead(paths, engine, repeat)
+        # how many times faster than the original parser
+        baseline = results["read_file"][file_type + "_baseline"]["seconds"]
+        results["speedup"][file_type] = {"{0}_per_baseline".format(engine): baseline / results["read_file"][file_type + "_" + engine]["seconds"]
+                                         for engine in file_parser.PARSER_ENGINES}
+    for engine in file_parser.PARSER_ENGINES:
+        # one file at a time, the peak of a single parse is what matters
+        results["memory"]["mesh_" + engine] = benchMemory(meshes[:1], engine)
+        if skeletons:
+            results["memory"]["skel_" + engine] = benchMemory(skeletons[:1], engine)
+    results["lazy"]["mesh"] = benchLazy(meshes, repeat)
+    results["lookup"]["mesh"] = benchLookup(meshes, repeat)
+    results["lookup"]["model"] = benchLookup(models, repeat)
+    payloads = []
+    for path in meshes:
+        payloads += getPayloads(path)
+    results["decode"] = benchDecode(payloads, repeat)
+    return results
+
+
+def compare(results, baseline, path=()):
+    # ratio of every seconds entry, baseline / current
+    for key, value in results.items():
+        if key not in baseline:
+            continue
+        if isinstance(value, dict):
+            compare(value, baseline[key], path + (key,))
+        elif key == "seconds" and baseline[key] and value:
+            print("{0:<40} {1:8.3f}x".format("/".join(path), baseline[key] / value))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the GTA V file parser.")
+    parser.add_argument("-o", "--output", default="", help="write the results to this json file")
+    parser.add_argument("--baseline", default="", help="compare with an earlier results file")
+    parser.add_argument("--corpus", default="", help="benchmark existing files instead of a generated corpus")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark, the best is kept (default: %(default)s)")
+    parser.add_argument("--components", type=int, default=4)
+    parser.add_argument("--vertices", type=int, default=20000)
+    parser.add_argument("--geometries", type=int, default=3)
+    parser.add_argument("--bones", type=int, default=200)
+    parser.add_argument("--depth", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = {"folder": args.corpus} if args.corpus else {
+        "components": args.components, "vertices": args.vertices, "geometries": args.geometries,
+        "bones": args.bones, "depth": args.depth, "seed": args.seed}
+    with tempfile.TemporaryDirectory() as temp:
+        if not args.corpus:
+            start = time.perf_counter()
+            generate.generate(temp, args.components, args.vertices, args.geometries, args.bones,
+                              args.depth, 1, args.seed)
+            print("generated corpus in {0:.2f}s".format(time.perf_counter() - start))
+        results = {
+            "parser_version": file_parser.PARSER_VERSION,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "corpus": corpus,
+            "results": run(args.corpus or temp, args.repeat),
+        }
+
+    for group, benchmarks in results["results"].items():
+        for name, result in benchmarks.items():
+            rates = ", ".join("{0} {1:.1f}".format(key, value) for key, value in result.items()
+                              if key.endswith(("per_second", "per_lookup", "per_mb", "per_baseline")))
+            print("{0:<8} {1:<14} {2}".format(group, name, rates or result))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print("speedup against {0}:".format(args.baseline))
+        compare(results["results"], baseline["results"])
+
+
+if __name__ == "__main__":
+    main()
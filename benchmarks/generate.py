@@ -0,0 +1,205 @@
+"""Write a synthetic .odd/.odr/.mesh/.skel tree for testing and benchmarks.
+
+    python benchmarks/generate.py OUTPUT [options]
+
+The files follow the layout the importer reads, with random geometry. Every
+vertex declaration in file_parser.vertexStructures is used in turn, skinned
+declarations get weights and bone indices for the generated skeleton.
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import file_parser
+
+# number of values written for every vertex attribute
+attributeSizes = {"pos": 3, "normal": 3, "color": 4, "undef1": 4, "undef2": 4,
+                  "uv": 2, "uv2": 2, "weights": 4, "bone_indices": 4}
+LODS = ("High", "Med", "Low", "Vlow")
+
+
+def formatRows(rows, fmt):
+    return "\n".join(" ".join(fmt % value for value in row) for row in rows)
+
+
+def getVertexLines(rng, declaration, vertex_count, bone_count, indent):
+    structure = file_parser.vertexStructures[declaration]
+    groups = []
+    for key in sorted(structure, key=structure.get):
+        size = attributeSizes[key]
+        if key == "pos":
+            values = rng.uniform(-1.0, 1.0, (vertex_count, size))
+            fmt = "%.6f"
+        elif key == "normal":
+            values = rng.normal(size=(vertex_count, size))
+            values /= np.linalg.norm(values, axis=1, keepdims=True)
+            fmt = "%.6f"
+        elif key in ("uv", "uv2"):
+            values = rng.uniform(0.0, 1.0, (vertex_count, size))
+            fmt = "%.6f"
+        elif key == "weights":
+            values = rng.integers(0, 256, (vertex_count, size))
+            values[:, 0] = 255 - values[:, 1:].sum(axis=1) % 256
+            fmt = "%d"
+        elif key == "bone_indices":
+            values = rng.integers(0, max(bone_count, 1), (vertex_count, size))
+            fmt = "%d"
+        else:
+            values = rng.integers(0, 256, (vertex_count, size))
+            fmt = "%d"
+        groups.append([" ".join(fmt % value for value in row) for row in values])
+    return [indent + " / ".join(parts) for parts in zip(*groups)]
+
+
+def getIndexLines(rng, vertex_count, indent):
+    # triangles over neighbouring vertices, like a strip, so meshes stay valid
+    count = max(vertex_count - 2, 1)
+    starts = rng.integers(0, count, count)
+    faces = np.stack([starts, starts + 1, starts + 2], axis=1) % max(vertex_count, 1)
+    values = faces.ravel()
+    return [indent + " ".join(str(value) for value in values[i:i + 15]) for i in range(0, len(values), 15)], len(values)
+
+
+def writeMesh(path, rng, declarations, vertex_count, bone_count, depth=0):
+    skinned = any(declaration.startswith("S") for declaration in declarations)
+    lines = ["Version 165 32", "{",
+             "\tSkinned {0}".format(skinned),
+             "\tBoneCount {0}".format(bone_count if skinned else 0),
+             "\tBounds", "\t{", "\t\tAabb", "\t\t{",
+             "\t\t\tMin -1.0 -1.0 -1.0", "\t\t\tMax 1.0 1.0 1.0",
+             "\t\t}", "\t}"]
+    # optional empty nesting to stress the member tree
+    tab = "\t"
+    for level in range(depth):
+        lines += [tab + "Group{0}".format(level), tab + "{", tab + "\tLevel {0}".format(level)]
+        tab += "\t"
+    lines += [tab + "Geometries", tab + "{"]
+    for num, declaration in enumerate(declarations):
+        inner = tab + "\t\t"
+        index_lines, index_count = getIndexLines(rng, vertex_count, inner + "\t")
+        lines += [tab + "\tGeometry", tab + "\t{",
+                  inner + "ShaderIndex {0}".format(num),
+                  inner + "Flags -",
+                  inner + "VertexDeclaration {0}".format(declaration),
+                  inner + "Indices {0}".format(index_count), inner + "{"]
+        lines += index_lines
+        lines += [inner + "}", inner + "Vertices {0}".format(vertex_count), inner + "{"]
+        lines += getVertexLines(rng, declaration, vertex_count, bone_count, inner + "\t")
+        lines += [inner + "}", tab + "\t}"]
+    lines += [tab + "}"]
+    for level in reversed(range(depth)):
+        tab = tab[:-1]
+        lines += [tab + "}"]
+    lines += ["}"]
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def writeSkeleton(path, rng, bone_count):
+    # random tree, every bone's parent is one of the bones before it
+    parents = [-1] + [int(rng.integers(0, index)) for index in range(1, bone_count)]
+    children = {index: [] for index in range(bone_count)}
+    for index, parent in enumerate(parents[1:], 1):
+        children[parent].append(index)
+
+    lines = ["Version 107 11", "{", "\tNumBones {0}".format(bone_count)]
+    # depth first without recursion, so long chains don't hit the recursion limit
+    stack = [(0, "\t")]
+    while stack:
+        index, tab = stack.pop()
+        if index is None:
+            lines.append(tab)
+            continue
+        rotation = rng.normal(size=4)
+        rotation /= np.linalg.norm(rotation)
+        lines += [tab + "Bone bone_{0}".format(index), tab + "{",
+                  tab + "\tIndex {0}".format(index),
+                  tab + "\tId {0}".format(index),
+                  tab + "\tLocalOffset " + formatRows([rng.uniform(-0.2, 0.2, 3)], "%.8f"),
+                  tab + "\tRotationQuaternion " + formatRows([rotation], "%.8f"),
+                  tab + "\tScale 1.00000000 1.00000000 1.00000000"]
+        stack.append((None, tab + "}"))
+        if children[index]:
+            lines += [tab + "\tChildren {0}".format(len(children[index])), tab + "\t{"]
+            stack.append((None, tab + "\t}"))
+            stack.extend((child, tab + "\t\t") for child in reversed(children[index]))
+    lines.append("}")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def writeODR(path, name, lods, shader_count, skeleton=None):
+    lines = ["Version 165 32", "{", "\tShaders", "\t{"]
+    for num in range(shader_count):
+        lines += ["\t\tgta_default.sps", "\t\t{",
+                  "\t\t\tDiffuseSampler {0}_diff_{1}".format(name, num),
+                  "\t\t\tBumpSampler {0}_n_{1}".format(name, num),
+                  "\t\t\tBumpiness 1.00000000",
+                  "\t\t}"]
+    lines += ["\t}", "\tSkeleton {0}".format(skeleton or "null"), "\tLodGroup", "\t{"]
+    for lod in lods:
+        lines += ["\t\t{0} 9999.00000000".format(lod), "\t\t{",
+                  "\t\t\t{0}\\{0}_{1}.mesh 0".format(name, lod.lower()), "\t\t}"]
+    lines += ["\t}", "}"]
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def generate(output, components=3, vertices=1000, geometries=2, bones=0, depth=0, lods=1, seed=0):
+    """Write a model.odd with its components into output and return its path.
+
+    Geometries cycle through the vertex declarations, only the unskinned
+    ones are used without bones. With bones, model/model.skel is written.
+    """
+    rng = np.random.default_rng(seed)
+    declarations = sorted(file_parser.vertexStructures)
+    if not bones:
+        declarations = [declaration for declaration in declarations if not declaration.startswith("S")]
+    os.makedirs(output, exist_ok=True)
+
+    names = []
+    cycle = 0
+    for component in range(components):
+        name = "component_{0:03d}".format(component)
+        names.append(name)
+        os.makedirs(os.path.join(output, name), exist_ok=True)
+        mesh_declarations = []
+        for num in range(geometries):
+            mesh_declarations.append(declarations[cycle % len(declarations)])
+            cycle += 1
+        for lod_num, lod in enumerate(LODS[:lods]):
+            mesh_path = os.path.join(output, name, "{0}_{1}.mesh".format(name, lod.lower()))
+            writeMesh(mesh_path, rng, mesh_declarations, max(vertices >> lod_num, 3), bones, depth)
+        writeODR(os.path.join(output, name + ".odr"), name, LODS[:lods], geometries)
+
+    if bones:
+        os.makedirs(os.path.join(output, "model"), exist_ok=True)
+        writeSkeleton(os.path.join(output, "model", "model.skel"), rng, bones)
+
+    odd_path = os.path.join(output, "model.odd")
+    with open(odd_path, "w") as f:
+        f.write("\n".join(["Version 165 32", "{"] + ["\t{0}.odr".format(name) for name in names] + ["}"]) + "\n")
+    return odd_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic GTA V model tree.")
+    parser.add_argument("output", help="output folder")
+    parser.add_argument("--components", type=int, default=3, help="number of .odr files (default: %(default)s)")
+    parser.add_argument("--vertices", type=int, default=1000, help="vertices per geometry (default: %(default)s)")
+    parser.add_argument("--geometries", type=int, default=2, help="geometries per mesh (default: %(default)s)")
+    parser.add_argument("--bones", type=int, default=0, help="skeleton size, 0 writes no skeleton (default: %(default)s)")
+    parser.add_argument("--depth", type=int, default=0, help="extra block nesting in meshes (default: %(default)s)")
+    parser.add_argument("--lods", type=int, default=1, choices=range(1, 5), help="LODs per component (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(generate(args.output, args.components, args.vertices, args.geometries, args.bones,
+                   args.depth, args.lods, args.seed))
+
+
+if __name__ == "__main__":
+    main()
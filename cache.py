@@ -0,0 +1,166 @@
+try:
+    from . import file_parser
+except ImportError:
+    import file_parser
+
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+
+# folder used when the operator does not set one
+ENV_FOLDER = "GTA_IMPORTER_CACHE"
+# size limit in MB
+ENV_SIZE = "GTA_IMPORTER_CACHE_SIZE"
+DEFAULT_SIZE = 2048
+
+_caches = {}
+
+
+def encodeTree(node, arrays):
+    # replace arrays by references into the arrays list, positions is a view
+    # on the vertices and gets rebuilt on load
+    if isinstance(node, np.ndarray):
+        arrays.append(node)
+        return {"__array__": len(arrays) - 1}
+    # members of trees parsed in worker processes come from the top level
+    # file_parser module, so check for the mapping interface instead of the class
+    if hasattr(node, "items"):
+        return {key: encodeTree(value, arrays) for key, value in node.items()
+                if not (key == "positions" and "columns" in node)}
+    if isinstance(node, (list, tuple)):
+        return [encodeTree(value, arrays) for value in node]
+    return node
+
+
+def decodeTree(node, folder):
+    if isinstance(node, dict):
+        if "__array__" in node:
+            return np.load(os.path.join(folder, "{0}.npy".format(node["__array__"])), mmap_mode="r")
+        return file_parser.toMember((key, decodeTree(value, folder)) for key, value in node.items())
+    if isinstance(node, list):
+        return [decodeTree(value, folder) for value in node]
+    return node
+
+
+class ParseCache:
+    """Parsed files stored on disk, one folder per entry.
+
+    An entry holds the member tree as a small json header and every vertex
+    and index array as a .npy file that is memory mapped on load. Entries
+    are keyed by absolute path, size, mtime and parser version, and the
+    least recently used ones are evicted once the folder exceeds max_size.
+    """
+
+    def __init__(self, folder, max_size=DEFAULT_SIZE):
+        self.folder = folder
+        self.max_size = max_size * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def getKey(self, filepath):
+        stat = os.stat(filepath)
+        source = "{0}|{1}|{2}|{3}".format(os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns,
+                                          file_parser.PARSER_VERSION)
+        return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+    def load(self, filepath):
+        try:
+            entry = os.path.join(self.folder, self.getKey(filepath))
+            with open(os.path.join(entry, "tree.json"), "r") as file:
+                tree = json.load(file)
+            data = decodeTree(tree, entry)
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        # mark as recently used
+        os.utime(entry)
+        self.hits += 1
+        parser = file_parser.GTA_Parser()
+        parser.setSource(filepath)
+        parser.data = data
+        return parser
+
+    def store(self, parser):
+        try:
+            key = self.getKey(parser.path)
+        except OSError:
+            return False
+        parser.materialize()
+        entry = os.path.join(self.folder, key)
+        temp = "{0}.{1}.tmp".format(entry, os.getpid())
+        arrays = []
+        tree = encodeTree(parser.data, arrays)
+        try:
+            os.makedirs(temp, exist_ok=True)
+            for index, array in enumerate(arrays):
+                np.save(os.path.join(temp, "{0}.npy".format(index)), np.ascontiguousarray(array))
+            with open(os.path.join(temp, "tree.json"), "w") as file:
+                json.dump(tree, file, separators=(",", ":"))
+            if os.path.isdir(entry):
+                shutil.rmtree(entry, ignore_errors=True)
+            os.replace(temp, entry)
+        except OSError as error:
+            print("could not write cache entry for {0}: {1}".format(parser.path, error))
+            shutil.rmtree(temp, ignore_errors=True)
+            return False
+        self.stores += 1
+        self.evict()
+        return True
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.folder):
+            entry = os.path.join(self.folder, name)
+            if name.endswith(".tmp") or not os.path.isdir(entry):
+                continue
+            size = sum(f.stat().st_size for f in os.scandir(entry) if f.is_file())
+            entries.append((os.stat(entry).st_mtime, size, entry))
+            total += size
+        entries.sort()
+        while total > self.max_size and entries:
+            _, size, entry = entries.pop(0)
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        for name in os.listdir(self.folder):
+            shutil.rmtree(os.path.join(self.folder, name), ignore_errors=True)
+
+    def report(self):
+        return "parse cache: {0} hits, {1} misses, {2} stored, {3} evicted".format(
+            self.hits, self.misses, self.stores, self.evictions)
+
+
+def resolveFolder(folder):
+    # resolve blender relative paths ("//cache") when running inside blender
+    if folder.startswith("//"):
+        try:
+            import bpy
+            return bpy.path.abspath(folder)
+        except ImportError:
+            pass
+    return os.path.expanduser(folder)
+
+
+def getCache(folder="", max_size=0):
+    """Return the cache for folder, or the one set by the environment.
+
+    Returns None when caching is not enabled.
+    """
+    folder = folder or os.environ.get(ENV_FOLDER, "")
+    if not folder:
+        return None
+    if not max_size:
+        max_size = int(os.environ.get(ENV_SIZE, DEFAULT_SIZE))
+    folder = os.path.abspath(resolveFolder(folder))
+    if folder not in _caches:
+        _caches[folder] = ParseCache(folder, max_size)
+    _caches[folder].max_size = max_size * 1024 * 1024
+    return _caches[folder]
@@ -0,0 +1,360 @@
+"""SQLite catalog of an extracted asset library.
+
+    python catalog.py library.sqlite index ROOT [ROOT ...]
+    python catalog.py library.sqlite query [--name N] [--shader S] [--skeleton K] [--min-vertices V] [--max-vertices V]
+
+Indexing walks the roots once and records every file, every model with its
+components, LODs, skeleton, shaders and samplers, the vertex counts of all
+meshes and the texture files the samplers refer to. Running it again only
+re-reads files whose size or mtime changed. The import resolves paths from
+the catalog (see resolver.PathResolver) instead of probing the disk.
+"""
+
+try:
+    from . import file_parser
+    from . import inspector
+except ImportError:
+    import file_parser
+    import inspector
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+
+# catalog used when the operator does not set one
+ENV_FILE = "GTA_IMPORTER_CATALOG"
+TEXTURE_EXTENSIONS = (".dds", ".png", ".bmp", ".jpeg", ".jpg", ".tga")
+MODEL_EXTENSIONS = (".odd", ".odr", ".mesh", ".skel")
+# catalogs of an older layout are emptied and have to be indexed again
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS roots (key TEXT PRIMARY KEY, path TEXT, scanned REAL);
+CREATE TABLE IF NOT EXISTS files (
+    key TEXT PRIMARY KEY, path TEXT, folder TEXT, name TEXT, extension TEXT,
+    is_dir INTEGER, size INTEGER, mtime REAL, walk_order INTEGER);
+CREATE INDEX IF NOT EXISTS files_folder ON files (folder);
+CREATE INDEX IF NOT EXISTS files_name ON files (name);
+CREATE TABLE IF NOT EXISTS models (key TEXT PRIMARY KEY, path TEXT, name TEXT, type TEXT, skeleton TEXT);
+CREATE INDEX IF NOT EXISTS models_name ON models (name);
+CREATE TABLE IF NOT EXISTS components (model TEXT, position INTEGER, path TEXT, key TEXT);
+CREATE INDEX IF NOT EXISTS components_model ON components (model);
+CREATE TABLE IF NOT EXISTS lods (model TEXT, lod TEXT, position INTEGER, path TEXT, key TEXT);
+CREATE INDEX IF NOT EXISTS lods_model ON lods (model);
+CREATE TABLE IF NOT EXISTS meshes (
+    key TEXT PRIMARY KEY, path TEXT, skinned INTEGER, bone_count INTEGER,
+    geometries INTEGER, vertices INTEGER, triangles INTEGER);
+CREATE TABLE IF NOT EXISTS shaders (model TEXT, position INTEGER, name TEXT);
+CREATE INDEX IF NOT EXISTS shaders_model ON shaders (model);
+CREATE INDEX IF NOT EXISTS shaders_name ON shaders (name);
+CREATE TABLE IF NOT EXISTS samplers (model TEXT, shader INTEGER, sampler TEXT, texture TEXT);
+CREATE INDEX IF NOT EXISTS samplers_model ON samplers (model);
+CREATE TABLE IF NOT EXISTS textures (model TEXT, texture TEXT, path TEXT);
+CREATE INDEX IF NOT EXISTS textures_model ON textures (model);
+"""
+
+_catalogs = {}
+
+
+def getKey(path):
+    return os.path.normcase(os.path.normpath(os.path.abspath(path)))
+
+
+class Catalog:
+    """Index of the files and models below one or more library roots."""
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.connection = sqlite3.connect(filepath)
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            tables = [row[0] for row in self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+            if tables:
+                print("catalog {0} has an older layout, index its roots again".format(filepath))
+            for table in tables:
+                self.connection.execute("DROP TABLE {0}".format(table))
+            self.connection.execute("PRAGMA user_version = {0}".format(SCHEMA_VERSION))
+        self.connection.executescript(SCHEMA)
+        self.roots = [row[0] for row in self.connection.execute("SELECT key FROM roots")]
+        self.queries = 0
+
+    def close(self):
+        self.connection.close()
+
+    def covers(self, path):
+        key = getKey(path)
+        return any(key == root or key.startswith(root + os.sep) for root in self.roots)
+
+    # file lookups, used by resolver.PathResolver
+
+    def listDirectory(self, folder):
+        self.queries += 1
+        return [row[0] for row in self.connection.execute(
+            "SELECT path FROM files WHERE folder = ? ORDER BY walk_order", (getKey(folder),))]
+
+    def walk(self, folder):
+        """Same tuples and order as os.walk(folder, topdown=False), from the index."""
+        self.queries += 1
+        key = getKey(folder)
+        rows = self.connection.execute(
+            "SELECT folder, path, is_dir FROM files WHERE folder = ? OR folder LIKE ? ESCAPE '!' ORDER BY walk_order",
+            (key, escapeLike(key + os.sep) + "%"))
+        current = None
+        dirs, files = [], []
+        for row_folder, path, is_dir in rows:
+            if row_folder != current:
+                if current is not None:
+                    yield root, dirs, files
+                current, root = row_folder, os.path.dirname(path)
+                dirs, files = [], []
+            (dirs if is_dir else files).append(os.path.basename(path))
+        if current is not None:
+            yield root, dirs, files
+
+    # indexing
+
+    def scan(self, root, verbose=True):
+        """Index root, only files that changed since the last scan are parsed again."""
+        start = time.perf_counter()
+        root = os.path.normpath(os.path.abspath(root))
+        root_key = getKey(root)
+        known = {key: (size, mtime) for key, size, mtime in self.connection.execute(
+            "SELECT key, size, mtime FROM files WHERE key = ? OR key LIKE ? ESCAPE '!'",
+            (root_key, escapeLike(root_key + os.sep) + "%"))}
+
+        rows = []
+        changed = []
+        order = 0
+        for folder, dirs, files in os.walk(root, topdown=False):
+            folder_key = getKey(folder)
+            for name in dirs + files:
+                path = os.path.join(folder, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                is_dir = name in dirs
+                key = getKey(path)
+                extension = "" if is_dir else os.path.splitext(name)[1].lower()
+                size, mtime = (0, 0.0) if is_dir else (stat.st_size, stat.st_mtime)
+                rows.append((key, path, folder_key, name.lower(), extension, is_dir, size, mtime, order))
+                order += 1
+                if extension in MODEL_EXTENSIONS and known.get(key) != (size, mtime):
+                    changed.append((key, path, extension))
+
+        removed = set(known) - {row[0] for row in rows}
+        with self.connection:
+            for key in removed:
+                self.removeEntries(key)
+            self.connection.execute("DELETE FROM files WHERE key = ? OR key LIKE ? ESCAPE '!'",
+                                    (root_key, escapeLike(root_key + os.sep) + "%"))
+            self.connection.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            for key, path, extension in changed:
+                self.removeEntries(key)
+                if extension == ".mesh":
+                    self.indexMesh(key, path)
+                elif extension in (".odr", ".odd"):
+                    self.indexModel(key, path, extension[1:])
+            # texture paths depend on the whole tree, rebuild them for the models of this root
+            self.connection.execute("DELETE FROM textures WHERE model = ? OR model LIKE ? ESCAPE '!'",
+                                    (root_key, escapeLike(root_key + os.sep) + "%"))
+            self.indexTextures(root_key)
+            self.connection.execute("INSERT OR REPLACE INTO roots VALUES (?, ?, ?)", (root_key, root, time.time()))
+        if root_key not in self.roots:
+            self.roots.append(root_key)
+        if verbose:
+            print("indexed {0}: {1} files, {2} parsed, {3} removed in {4:.2f}s".format(
+                root, len(rows), len(changed), len(removed), time.perf_counter() - start))
+        return len(changed)
+
+    def removeEntries(self, key):
+        for table, column in (("models", "key"), ("meshes", "key"), ("components", "model"), ("lods", "model"),
+                              ("shaders", "model"), ("samplers", "model"), ("textures", "model")):
+            self.connection.execute("DELETE FROM {0} WHERE {1} = ?".format(table, column), (key,))
+
+    def indexMesh(self, key, path):
+        info = inspector.inspectMesh(path)
+        self.connection.execute("INSERT INTO meshes VALUES (?, ?, ?, ?, ?, ?, ?)", (
+            key, path, int(info.get("skinned", False)), info.get("bone_count", 0),
+            len(info["geometries"]), info["vertices"], info["triangles"]))
+
+    def indexModel(self, key, path, model_type):
+        parser = file_parser.parseFile(path, lazy=True)
+        if not parser:
+            return
+        name = os.path.basename(path).split(".")[0]
+        folder = os.path.dirname(path)
+        skeleton = None
+        if model_type == "odd":
+            skel_path = os.path.join(folder, name, name + ".skel")
+            if self.connection.execute("SELECT 1 FROM files WHERE key = ?", (getKey(skel_path),)).fetchone():
+                skeleton = skel_path
+            root = parser.getMemberByName("Version")
+            for position, odr in enumerate(root["values"] if root else []):
+                odr_path = os.path.join(folder, *odr.split("\\"))
+                self.connection.execute("INSERT INTO components VALUES (?, ?, ?, ?)",
+                                        (key, position, odr_path, getKey(odr_path)))
+        else:
+            skel = parser.getMemberByName("Skeleton")
+            if skel and skel != "null":
+                skeleton = file_parser.getSkeletonPath(skel, folder)
+            shaders = parser.getMemberByName("Shaders")
+            for position, shader in enumerate(shaders["members"] if shaders else []):
+                self.connection.execute("INSERT INTO shaders VALUES (?, ?, ?)", (key, position, shader["name"]))
+                for sampler, texture in inspector.getSamplers(shader).items():
+                    self.connection.execute("INSERT INTO samplers VALUES (?, ?, ?, ?)", (key, position, sampler, texture))
+            lodgroup = parser.getMemberByName("LodGroup")
+            for position, (lod, mesh_path) in enumerate(file_parser.getMeshPaths(lodgroup, name, folder) if lodgroup else []):
+                self.connection.execute("INSERT INTO lods VALUES (?, ?, ?, ?, ?)",
+                                        (key, lod, position, mesh_path, getKey(mesh_path)))
+        self.connection.execute("INSERT INTO models VALUES (?, ?, ?, ?, ?)", (key, path, name, model_type, skeleton))
+
+    def indexTextures(self, root_key):
+        # texture files with the sampler's name, below the folder of the model's parent
+        rows = self.connection.execute(
+            "SELECT DISTINCT samplers.model, models.path, samplers.texture FROM samplers "
+            "JOIN models ON models.key = samplers.model WHERE samplers.model = ? OR samplers.model LIKE ? ESCAPE '!'",
+            (root_key, escapeLike(root_key + os.sep) + "%")).fetchall()
+        for model, path, texture in rows:
+            name = texture.split(".")[0].split("\\")[-1].lower()
+            if not name or "givemechecker" in name or "*null*" in name:
+                continue
+            near = getKey(os.path.dirname(os.path.dirname(path)))
+            for extension in TEXTURE_EXTENSIONS:
+                for (texture_path,) in self.connection.execute(
+                        "SELECT path FROM files WHERE name = ? AND (folder = ? OR folder LIKE ? ESCAPE '!') ORDER BY walk_order",
+                        (name + extension, near, escapeLike(near + os.sep) + "%")):
+                    self.connection.execute("INSERT INTO textures VALUES (?, ?, ?)", (model, texture, texture_path))
+
+    # queries
+
+    def findModels(self, name=None, shader=None, skeleton=None, min_vertices=None, max_vertices=None, model_type=None):
+        """Models matching all given filters, as dicts.
+
+        name, shader and skeleton match case-insensitive substrings. The
+        vertex count of an .odr is the one of its most detailed LOD, the one
+        of an .odd the sum over its components.
+        """
+        self.queries += 1
+        sql = ["SELECT models.key, models.path, models.name, models.type, models.skeleton, model_vertices.vertices "
+               "FROM models LEFT JOIN model_vertices ON model_vertices.model = models.key WHERE 1"]
+        arguments = []
+        if name:
+            sql.append("AND models.name LIKE ? ESCAPE '!'")
+            arguments.append("%" + escapeLike(name) + "%")
+        if skeleton:
+            sql.append("AND models.skeleton LIKE ? ESCAPE '!'")
+            arguments.append("%" + escapeLike(skeleton) + "%")
+        if shader:
+            sql.append("AND (models.key IN (SELECT model FROM shaders WHERE name LIKE ? ESCAPE '!') "
+                       "OR models.key IN (SELECT components_keys.model FROM component_keys AS components_keys "
+                       "JOIN shaders ON shaders.model = components_keys.component WHERE shaders.name LIKE ? ESCAPE '!'))")
+            arguments += ["%" + escapeLike(shader) + "%"] * 2
+        if min_vertices is not None:
+            sql.append("AND model_vertices.vertices >= ?")
+            arguments.append(min_vertices)
+        if max_vertices is not None:
+            sql.append("AND model_vertices.vertices <= ?")
+            arguments.append(max_vertices)
+        if model_type:
+            sql.append("AND models.type = ?")
+            arguments.append(model_type)
+        sql.append("ORDER BY models.path")
+        self.createViews()
+        return [{"path": path, "name": model_name, "type": found_type, "skeleton": skel, "vertices": vertices}
+                for key, path, model_name, found_type, skel, vertices
+                in self.connection.execute(" ".join(sql), arguments)]
+
+    def getModel(self, path):
+        """Everything the catalog knows about one model, None if it is not indexed."""
+        self.queries += 1
+        key = getKey(path)
+        row = self.connection.execute("SELECT path, name, type, skeleton FROM models WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        info = dict(zip(("path", "name", "type", "skeleton"), row))
+        info["components"] = [path for (path,) in self.connection.execute(
+            "SELECT path FROM components WHERE model = ? ORDER BY position", (key,))]
+        info["lods"] = [(lod, path) for lod, path in self.connection.execute(
+            "SELECT lod, path FROM lods WHERE model = ? ORDER BY position", (key,))]
+        info["shaders"] = [{"name": shader_name, "samplers": dict(self.connection.execute(
+            "SELECT sampler, texture FROM samplers WHERE model = ? AND shader = ?", (key, position)).fetchall())}
+            for position, shader_name in self.connection.execute(
+                "SELECT position, name FROM shaders WHERE model = ? ORDER BY position", (key,))]
+        info["textures"] = {}
+        for texture, texture_path in self.connection.execute("SELECT texture, path FROM textures WHERE model = ?", (key,)):
+            info["textures"].setdefault(texture, []).append(texture_path)
+        return info
+
+    def getMesh(self, path):
+        row = self.connection.execute(
+            "SELECT path, skinned, bone_count, geometries, vertices, triangles FROM meshes WHERE key = ?",
+            (getKey(path),)).fetchone()
+        return dict(zip(("path", "skinned", "bone_count", "geometries", "vertices", "triangles"), row)) if row else None
+
+    def createViews(self):
+        self.connection.executescript("""
+            CREATE TEMP VIEW IF NOT EXISTS component_keys AS
+                SELECT components.model AS model, files.key AS component
+                FROM components JOIN files ON files.key = components.key;
+            CREATE TEMP VIEW IF NOT EXISTS odr_vertices AS
+                SELECT lods.model AS model, MAX(meshes.vertices) AS vertices
+                FROM lods JOIN files ON files.key = lods.key JOIN meshes ON meshes.key = files.key
+                GROUP BY lods.model;
+            CREATE TEMP VIEW IF NOT EXISTS model_vertices AS
+                SELECT model, vertices FROM odr_vertices
+                UNION ALL
+                SELECT component_keys.model, SUM(odr_vertices.vertices)
+                FROM component_keys JOIN odr_vertices ON odr_vertices.model = component_keys.component
+                GROUP BY component_keys.model;
+        """)
+
+
+def escapeLike(text):
+    return text.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+
+
+def getCatalog(filepath=""):
+    """Open the catalog at filepath (or $GTA_IMPORTER_CATALOG), None if there is none."""
+    filepath = filepath or os.environ.get(ENV_FILE, "")
+    if not filepath or not os.path.exists(filepath):
+        return None
+    key = getKey(filepath)
+    if key not in _catalogs:
+        _catalogs[key] = Catalog(filepath)
+    return _catalogs[key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index and search extracted GTA V model libraries.")
+    parser.add_argument("catalog", help="sqlite database file, created if missing")
+    commands = parser.add_subparsers(dest="command", required=True)
+    index = commands.add_parser("index", help="scan library roots, only changed files are read again")
+    index.add_argument("roots", nargs="*", help="library folders, default: every root indexed before")
+    query = commands.add_parser("query", help="list models as json")
+    query.add_argument("--name")
+    query.add_argument("--shader")
+    query.add_argument("--skeleton")
+    query.add_argument("--min-vertices", type=int)
+    query.add_argument("--max-vertices", type=int)
+    query.add_argument("--type", choices=["odd", "odr"])
+    show = commands.add_parser("show", help="print everything known about a model")
+    show.add_argument("model")
+    args = parser.parse_args()
+
+    catalog = Catalog(args.catalog)
+    if args.command == "index":
+        roots = args.roots or [row[0] for row in catalog.connection.execute("SELECT path FROM roots")]
+        for root in roots:
+            catalog.scan(root)
+    elif args.command == "query":
+        print(json.dumps(catalog.findModels(args.name, args.shader, args.skeleton,
+                                            args.min_vertices, args.max_vertices, args.type), indent=2))
+    else:
+        print(json.dumps(catalog.getModel(args.model), indent=2))
+    catalog.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,41 @@
-from mathutils import (Vector, Quaternion, Matrix, Euler)
+try:
+    from . import profiling
+except ImportError:
+    import profiling
+
 from enum import Enum
+import numpy as np
 import os
+import re
+import sys
+import time
+
+# "fast" tokenizes the whole file buffer iteratively, "legacy" is the recursive
+# line scanner of the original parser with the same payload decoding. Both
+# produce the same member tree, benchmarks/baseline_parser.py keeps the
+# original parser for comparison.
+PARSER_ENGINES = ("fast", "legacy")
+default_engine = "fast"
+# bump whenever the layout of the member tree changes, cached parses depend on it
+PARSER_VERSION = 1
+
+# attribute groups of every vertex line, in file order
+vertexStructures = {
+    "N209731BE": {"pos": 0, "normal": 1, "color": 2, "uv": 3},
+    "N51263BB5": {"pos": 0, "normal": 1, "color": 2, "uv": 3, "undef2": 4},
+    "S9445853F": {"pos": 0, "weights": 1, "bone_indices": 2, "normal": 3, "color": 4, "uv": 5, "undef2": 6},
+    "S12D0183F": {"pos": 0, "weights": 1, "bone_indices": 2, "normal": 3, "color": 4, "undef1": 5, "uv": 6, "uv2": 7, "undef2": 8},
+    "SD7D22350": {"pos": 0, "weights": 1, "bone_indices": 2, "normal": 3, "color": 4, "undef1": 5, "uv": 6, "undef2": 7},
+    "SBED48839": {"pos": 0, "weights": 1, "bone_indices": 2, "normal": 3, "color": 4, "undef1": 5, "uv": 6},
+    "NC794193B": {"pos": 0, "normal": 1, "color": 2, "bone_indices": 3, "uv": 4, "uv2": 5, "undef1": 6},
+    "S1E9F420D": {"pos": 0, "weights": 1, "bone_indices": 2, "normal": 3, "color": 4, "uv": 5}
+
+}
+
+# bytes of text decoded at once by the tokenizer, bounds the memory of the line lists
+splitSize = 1 << 12
+# a Vertices/Indices line followed by the "{" line of its payload, up to the payload itself
+payloadStart = re.compile(rb"[^\S\n]*(?:Vertices|Indices)(?:[^\S\n][^\n]*)?\n[^\S\n]*\{(?:[^\S\n][^\n]*)?(?:\n|$)")
 
 class ValueType(Enum):
     DEFAULT = 1
@@ -8,110 +43,585 @@ class ValueType(Enum):
     VERTICES = 3
     BONE = 4
 
+
+def getValueType(line):
+    name = line[0]
+    if name == "Indices":
+        return ValueType.INDICES
+    if name == "Vertices":
+        return ValueType.VERTICES
+    else:
+        return ValueType.DEFAULT
+
+
+class Member:
+    """Block of the member tree.
+
+    Works like the dict blocks used to be: member["name"], member["members"],
+    member.get("Skinned"), "faces" in member, member.items(). name,
+    attributes, members and values are slots, every other key (properties
+    and decoded payloads) goes into a dict that is only created for blocks
+    that have one. Keys are interned and attributes are a tuple. There is no
+    values() method, "values" is one of the keys. Add children and values
+    with addMember and addValue.
+    """
+
+    __slots__ = ("name", "attributes", "members", "values", "properties")
+    fields = ("name", "attributes", "members", "values")
+
+    def __init__(self, name="", attributes=(), members=(), values=(), properties=None):
+        # empty blocks share the empty tuple, lists are created on the first append
+        self.name = name
+        self.attributes = attributes
+        self.members = members
+        self.values = values
+        self.properties = properties
+
+    def __getitem__(self, key):
+        if key in Member.fields:
+            return getattr(self, key)
+        if self.properties is not None and key in self.properties:
+            return self.properties[key]
+        return self.__missing__(key)
+
+    def __missing__(self, key):
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in Member.fields:
+            setattr(self, key, value)
+        elif self.properties is None:
+            self.properties = {sys.intern(key): value}
+        else:
+            self.properties[sys.intern(key)] = value
+
+    def __contains__(self, key):
+        return key in Member.fields or (self.properties is not None and key in self.properties)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def pop(self, key, *default):
+        if self.properties is not None and key in self.properties:
+            return self.properties.pop(key)
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def keys(self):
+        return list(Member.fields) + list(self.properties or ())
+
+    def items(self):
+        items = [(key, getattr(self, key)) for key in Member.fields]
+        if self.properties:
+            items.extend(self.properties.items())
+        return items
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(Member.fields) + len(self.properties or ())
+
+    def __repr__(self):
+        return "Member({0!r}, {1!r}, {2} members)".format(self.name, self.attributes, len(self.members))
+
+
+def addMember(member, child):
+    if not member.members:
+        member.members = []
+    member.members.append(child)
+
+
+def addValue(member, value):
+    if not member.values:
+        member.values = []
+    member.values.append(value)
+
+
+def newMember(v_type=ValueType.DEFAULT):
+    member = Member()
+    if v_type == ValueType.INDICES:
+        member["faces"] = np.zeros((0, 3), dtype=np.int32)
+    elif v_type == ValueType.VERTICES:
+        setVertexData(member, np.zeros((0, 3), dtype=np.float32), [(0, 3)])
+    return member
+
+
+def toMember(items):
+    """Rebuild a Member from (key, value) pairs, e.g. after json or shared memory."""
+    member = Member()
+    for key, value in items:
+        if isinstance(value, list) and key not in ("members", "values", "columns"):
+            value = tuple(value)
+        member[key] = value
+    if "columns" in member:
+        setVertexData(member, member["vertices"], [tuple(c) for c in member["columns"]])
+    return member
+
+
+def setVertexData(member, vertices, columns):
+    """Attach a decoded (N, C) float32 vertex array to a Vertices member.
+
+    columns holds one (start, stop) range per attribute group of the vertex
+    declaration. positions is a view on the first group.
+    """
+    member["vertices"] = vertices
+    member["columns"] = columns
+    member["positions"] = vertices[:, columns[0][0]:columns[0][1]]
+
+
+def getVertexAttribute(member, group_index):
+    start, stop = member["columns"][group_index]
+    return member["vertices"][:, start:stop]
+
+
+def setMemberName(member, split):
+    member.name = sys.intern(split[0])
+    if len(split) > 1:
+        member.attributes = tuple(split[1:])
+
+
+def addPrevLine(member, prev_line):
+    if prev_line:
+        if len(prev_line) > 1:
+            member[prev_line[0]] = tuple(prev_line[1:]) if len(prev_line) > 2 else prev_line[1]
+        else:
+            addValue(member, prev_line[0])
+
+
+def decodeVertices(chunk, member, declaration=None):
+    # chunk is the raw bytes of the block, the attribute layout is taken from the first vertex line, the numbers
+    # themselves are converted in one go
+    with profiling.stage("decode vertices"):
+        first = chunk.lstrip().split(b"\n", 1)[0]
+        group_sizes = [len(sp.split()) for sp in first.split(b' / ')]
+        stride = sum(group_sizes)
+        if not stride:
+            return
+        if declaration in vertexStructures and len(vertexStructures[declaration]) != len(group_sizes):
+            print("vertex declaration {0} does not match vertex layout {1}".format(declaration, group_sizes))
+        values = np.fromstring(chunk.replace(b"/", b" "), dtype=np.float32, sep=" ")
+        if values.size % stride:
+            print("incomplete vertex data, {0} trailing values dropped".format(values.size % stride))
+            values = values[:values.size - values.size % stride]
+        columns = []
+        start = 0
+        for size in group_sizes:
+            columns.append((start, start + size))
+            start += size
+        setVertexData(member, values.reshape(-1, stride), columns)
+        profiling.count("vertices decoded", values.size // stride)
+
+
+def decodeFaces(chunk, member):
+    with profiling.stage("decode indices"):
+        indices = np.fromstring(chunk, dtype=np.int32, sep=" ")
+        if indices.size % 3:
+            print("incomplete index data, {0} trailing indices dropped".format(indices.size % 3))
+            indices = indices[:indices.size - indices.size % 3]
+        member["faces"] = indices.reshape(-1, 3)
+        profiling.count("indices decoded", indices.size)
+
+
+class LazyBlock(Member):
+    """Vertices/Indices block that decodes its payload on first access.
+
+    Only the byte range of the payload in the source file is kept, together
+    with the number of payload lines. Reading "vertices", "positions",
+    "columns" or "faces" reads the range from the file and decodes it.
+    """
+
+    __slots__ = ("v_type", "filepath", "start", "end", "line_count", "declaration", "mtime", "loaded")
+    payload_keys = {ValueType.VERTICES: ("vertices", "positions", "columns"), ValueType.INDICES: ("faces",)}
+
+    def __init__(self, member, v_type, filepath, start, end, line_count, declaration=None):
+        super().__init__(member.name, member.attributes, member.members, member.values,
+                         dict(member.properties) if member.properties else None)
+        self.v_type = v_type
+        self.filepath = filepath
+        self.start = start
+        self.end = end
+        self.line_count = line_count
+        self.declaration = declaration
+        self.mtime = os.path.getmtime(filepath)
+        self.loaded = False
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        if os.path.getmtime(self.filepath) != self.mtime:
+            print("file changed since it was scanned: {0}".format(self.filepath))
+        with open(self.filepath, 'rb') as file:
+            file.seek(self.start)
+            chunk = file.read(self.end - self.start)
+        if self.v_type == ValueType.VERTICES:
+            setVertexData(self, np.zeros((0, 3), dtype=np.float32), [(0, 3)])
+            decodeVertices(chunk, self, self.declaration)
+        else:
+            decodeFaces(chunk, self)
+
+    def __missing__(self, key):
+        if not self.loaded and key in self.payload_keys[self.v_type]:
+            self.load()
+            return self[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return super().__contains__(key) or (not self.loaded and key in self.payload_keys[self.v_type])
+
+
+def getBlockCount(member):
+    """Number of vertices or indices of a payload block, without decoding it."""
+    if member["attributes"]:
+        try:
+            return int(member["attributes"][0])
+        except ValueError:
+            pass
+    if isinstance(member, LazyBlock) and not member.loaded:
+        if member.v_type == ValueType.VERTICES:
+            return member.line_count
+        return None
+    if "faces" in member:
+        return member["faces"].size
+    if "vertices" in member:
+        return len(member["vertices"])
+    return None
+
+
+def findPayload(buffer, pos):
+    """Offset of the first payload after pos, where the text after its "{" line starts, or -1."""
+    while True:
+        # a plain find is much faster than searching with the pattern
+        found = [index for index in (buffer.find(b"Vertices", pos), buffer.find(b"Indices", pos)) if index != -1]
+        if not found:
+            return -1
+        start = min(found)
+        line_start = buffer.rfind(b"\n", 0, start) + 1
+        # the name has to be the first token of its line
+        match = payloadStart.match(buffer, line_start) if not buffer[line_start:start].strip() else None
+        if match:
+            return match.end()
+        pos = start + 1
+
+
+def splitLines(buffer, start, end):
+    """Decoded lines of buffer[start:end], split in chunks of about splitSize bytes."""
+    while start < end:
+        chunk_end = buffer.find(b"\n", start + splitSize) + 1 if end - start > splitSize else end
+        if not 0 < chunk_end < end:
+            chunk_end = end
+        lines = buffer[start:chunk_end].decode("utf-8", "replace").split("\n")
+        if not lines[-1]:
+            lines.pop()
+        yield from lines
+        start = chunk_end
+
+
+def tokenize(buffer, lazy_source=None):
+    """Build the member tree from a whole file buffer.
+
+    Works with an explicit stack instead of recursing per block. The text
+    between two payload blocks is decoded and split into lines a chunk at a
+    time, every line is split once and classified by its first token.
+    Vertices/Indices payloads contain no braces, so the tokenizer jumps
+    straight to the closing brace and decodes the payload as one chunk.
+    With lazy_source, the path of the buffer, payloads become LazyBlocks
+    that are decoded on first access.
+    """
+    root = newMember()
+    stack = [root]
+    prev_line = []
+    pos = 0
+    end = len(buffer)
+
+    while pos < end:
+        # everything up to and including the "{" line of the next payload block
+        segment_end = findPayload(buffer, pos)
+        if segment_end == -1:
+            segment_end = end
+        payload = None
+        for line in splitLines(buffer, pos, segment_end):
+            tokens = line.split()
+            if not tokens:
+                if prev_line:
+                    addPrevLine(stack[-1], prev_line)
+                prev_line = tokens
+                continue
+
+            first = tokens[0]
+            if first == "{":
+                v_type = getValueType(prev_line)
+                child = newMember(v_type)
+                setMemberName(child, prev_line)
+                addMember(stack[-1], child)
+                prev_line = []
+                if v_type == ValueType.DEFAULT:
+                    stack.append(child)
+                else:
+                    # only the last line of the segment opens a payload block
+                    payload = (child, v_type)
+            elif first == "}":
+                if prev_line:
+                    addPrevLine(stack[-1], prev_line)
+                prev_line = []
+                if len(stack) > 1:
+                    stack.pop()
+            else:
+                if prev_line:
+                    addPrevLine(stack[-1], prev_line)
+                prev_line = tokens
+        pos = segment_end
+        if payload is None:
+            continue
+
+        # payload blocks: decode everything up to the closing brace at once
+        child, v_type = payload
+        block_end = buffer.find(b"}", pos)
+        if block_end == -1:
+            block_end = end
+        declaration = stack[-1].get("VertexDeclaration")
+        if lazy_source:
+            for key in LazyBlock.payload_keys[v_type]:
+                child.pop(key)
+            child = LazyBlock(child, v_type, lazy_source, pos, block_end,
+                              buffer.count(b"\n", pos, block_end), declaration)
+            stack[-1].members[-1] = child
+        elif v_type == ValueType.VERTICES:
+            decodeVertices(buffer[pos:block_end], child, declaration)
+        else:
+            decodeFaces(buffer[pos:block_end], child)
+        line_end = buffer.find(b"\n", block_end)
+        pos = end if line_end == -1 else line_end + 1
+
+    return root
+
+
 class GTA_Parser:
     def __init__(self):
         self.name = ""
         self.path = ""
         self.folder = ""
         self.subfolder = ""
-        self.data_lines = []
         self.data = []
+        # size and parse time of the last read
+        self.stats = {"bytes": 0, "seconds": 0.0}
+
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self.index = None
+
+    def __getstate__(self):
+        # the index is rebuilt on demand, no need to pickle it
+        state = self.__dict__.copy()
+        state["index"] = None
+        return state
+
+    def buildIndex(self):
+        """Index the member tree by name and by path.
+
+        Names resolve to what a depth-first search would find first: the
+        properties of a block before its child blocks, children in order.
+        Paths are the block names from the top, e.g. "Version/LodGroup/High",
+        and resolve below the top block as well ("LodGroup/High").
+        """
+        names = {}
+        paths = {}
+
+        def addKeys(member, nested):
+            for key, value in member.items():
+                if key not in names and (value or not nested):
+                    names[key] = value
+
+        if isinstance(self.data, Member):
+            addKeys(self.data, False)
+            stack = [(iter(self.data.members), "")]
+            while stack:
+                member = next(stack[-1][0], None)
+                if member is None:
+                    stack.pop()
+                    continue
+                path = stack[-1][1] + member.name
+                names.setdefault(member.name, member)
+                paths.setdefault(path, member)
+                if member.members:
+                    addKeys(member, True)
+                    stack.append((iter(member.members), path + "/"))
+            # full paths win over the shortened ones
+            for path, member in list(paths.items()):
+                if "/" in path:
+                    paths.setdefault(path.partition("/")[2], member)
+        self.index = {"names": names, "paths": paths}
+        return self.index
 
     def getMemberByName(self, name):
-        def findMember(parent, name):
-            for key, value in parent.items():
-                if key == name:
-                    return value
-            for member in parent["members"]:
-                if member["name"] == name:
-                    return member
-                if member["members"]:
-                    res_children = findMember(member, name)
-                    if res_children:
-                        return res_children
-            return None
-        return findMember(self.data, name)
-
-    def read_file(self, filepath):
-        def getVertices(line, member):
-            raw_vertex = [sp.split() for sp in line.split(' / ')]
-            # vector_list = [Vector(float(p) for p in v) for v in raw_vertex]
-            vector_list = [Vector(map(float, v)) for v in raw_vertex]
-            member["vertices"].append(vector_list)
-            member["positions"].append(vector_list[0])
-
-        def getFaces(line, member):
-            raw_indeces = list(map(int, line.split()))
-            member["faces"].extend(zip(*(iter(raw_indeces),) * 3))
-            # member["faces"].extend([[raw_indeces[i*3], raw_indeces[i*3+1], raw_indeces[i*3+2]] for i in range(int(len(raw_indeces)/3))])
-
-        def setMemberName(member, split):
-            member["name"] = split[0]
-            if len(split) > 1:
-                member["attributes"] = split[1:]
-
-        def getValueType(line):
-            name = line[0]
-            if name == "Indices":
-                return ValueType.INDICES
-            if name == "Vertices":
-                return ValueType.VERTICES
-            else:
-                return ValueType.DEFAULT
+        index = self.index or self.buildIndex()
+        return index["names"].get(name)
 
+    def getMemberByPath(self, path):
+        """Return the block at path, or the property if the last part names one.
 
+        path starts at the top block ("Version/LodGroup/High") or below it
+        ("LodGroup/High").
+        """
+        index = self.index or self.buildIndex()
+        member = index["paths"].get(path)
+        if member is None:
+            parent, _, key = path.rpartition("/")
+            if parent:
+                parents = [index["paths"].get(parent)]
+            else:
+                parents = [self.data] + list(self.data.members if isinstance(self.data, Member) else ())
+            member = next((parent.get(key) for parent in parents if parent and parent.get(key) is not None), None)
+        return member
+
+    def read_legacy(self):
         def get_data_blocks(start_line, v_type=ValueType.DEFAULT):
-            this_member = {"name": "", "attributes": [], "members": [], "values": []}
+            this_member = newMember(v_type)
             prev_line = []
+            payload = []
             line_number = start_line
 
-            if v_type == ValueType.INDICES:
-                this_member["faces"] = []
-            elif v_type == ValueType.VERTICES:
-                this_member["positions"] = []
-                this_member["vertices"] = []
-
-            def addPrevLine(member, prev_line):
-                if prev_line:
-                    if len(prev_line) > 1:
-                        member[prev_line[0]] = prev_line[1:] if len(prev_line[1:]) > 1 else prev_line[1]
-                    else:
-                        member["values"].append(prev_line[0])
-
-            while line_number < len(self.data_lines):
-                line = self.data_lines[line_number]
+            while line_number < len(lines):
+                line = lines[line_number]
                 if "{" in line:
                      # jump to line afer last block
                     child_member, line_number = get_data_blocks(line_number + 1, getValueType(prev_line))
                     setMemberName(child_member, prev_line)
-                    this_member["members"].append(child_member)
+                    if child_member["name"] == "Vertices":
+                        decodeVertices("\n".join(child_member.pop("payload")).encode(), child_member, this_member.get("VertexDeclaration"))
+                    elif child_member["name"] == "Indices":
+                        decodeFaces("\n".join(child_member.pop("payload")).encode(), child_member)
+                    addMember(this_member, child_member)
                     # rest prev_line
                     prev_line = []
                     continue
                 elif "}" not in line:
-                    if v_type == ValueType.VERTICES:
-                        getVertices(line, this_member)
-                    elif v_type == ValueType.INDICES:
-                        getFaces(line, this_member)
+                    if v_type != ValueType.DEFAULT:
+                        payload.append(line)
                     else:
                         addPrevLine(this_member, prev_line)
                         prev_line = line.split()
                 elif "}" in line:
                     addPrevLine(this_member, prev_line)
+                    if v_type != ValueType.DEFAULT:
+                        this_member["payload"] = payload
                     return this_member, line_number + 1
                 line_number += 1
 
             return this_member
 
+        # the raw lines only live until the tree is built
+        with open(self.path, 'r') as file:
+            lines = file.read().splitlines()
+        self.data = get_data_blocks(0)
+        # get_data_blocks refers to itself, release the lines without waiting for the garbage collector
+        lines = None
+
+    def read_fast(self, lazy=False):
+        with open(self.path, 'rb') as file:
+            self.data = tokenize(file.read(), self.path if lazy else None)
+
+    def materialize(self):
+        """Decode all payloads that lazy reading skipped."""
+        stack = [self.data] if isinstance(self.data, Member) else []
+        while stack:
+            member = stack.pop()
+            if isinstance(member, LazyBlock):
+                member.load()
+            stack.extend(member.members)
+
+    def setSource(self, filepath):
+        self.name = os.path.basename(filepath).split(".")[0]
+        self.path = filepath
+        self.folder = os.path.dirname(filepath)
+        self.subfolder = os.path.join(self.folder, self.name)
+
+    def read_file(self, filepath, engine=None, lazy=False):
+        """Parse filepath into self.data.
+
+        lazy only scans the structure, Vertices/Indices payloads are decoded
+        when they are first accessed. It always uses the fast engine.
+
+        Memory target for the fast engine, per MB of input: a peak below
+        3 MB for .mesh files (the file buffer, one payload copy and the
+        decoded arrays) and below 6 MB for block heavy .skel/.odr/.odd
+        files. Only the member tree is kept afterwards, about 0.6 and 4 MB.
+        benchmarks/bench.py measures both.
+        """
         if filepath and os.path.exists(filepath):
-            self.name = os.path.basename(filepath).split(".")[0]
-            self.path = filepath
-            self.folder = os.path.dirname(filepath)
-            self.subfolder = os.path.join(self.folder, self.name)
-            with open(filepath, 'r') as file:
-                self.data_lines = file.read().splitlines()
-            self.data = get_data_blocks(0)
+            self.setSource(filepath)
+            start = time.perf_counter()
+            with profiling.stage("parse"):
+                if (engine or default_engine) == "legacy" and not lazy:
+                    self.read_legacy()
+                else:
+                    self.read_fast(lazy)
+            self.stats = {"bytes": os.path.getsize(filepath), "seconds": time.perf_counter() - start}
+            profiling.count("files parsed")
+            profiling.count("bytes parsed", self.stats["bytes"])
             return True
         else:
             print("path does not exist: {0}".format(filepath))
             return False
+
+
+def getChild(member, name):
+    for child in member["members"]:
+        if child["name"] == name:
+            return child
+    return None
+
+
+def getSkeletonPath(skel, folder):
+    if not isinstance(skel, str):
+        skel = " ".join(skel)
+    return os.path.join(folder, *skel.split("\\"))
+
+
+def getMeshPath(lodgroup, name, LOD, folder):
+    mesh_path = ""
+    # get LOD
+    LODs = []
+    match = False
+    for mesh in lodgroup["members"]:
+        for key, value in mesh.items():
+            if name in key and key.endswith(".mesh"):
+                path = os.path.join(folder, *key.split("\\"))
+                LODs.append(path)
+                if LOD == mesh["name"]:
+                    match = True
+                    mesh_path = path
+
+    # if no match take lowest LOD
+    if not match:
+        print("LOD not found, take lowest available")
+        mesh_path = LODs[-1]
+    return mesh_path
+
+
+def getMeshPaths(lodgroup, name, folder):
+    """List (LOD, path) of every mesh of the LodGroup, in file order."""
+    mesh_paths = []
+    for mesh in lodgroup["members"]:
+        for key, value in mesh.items():
+            if name in key and key.endswith(".mesh"):
+                mesh_paths.append((mesh["name"], os.path.join(folder, *key.split("\\"))))
+    return mesh_paths
+
+
+def parseFile(filepath, engine=None, lazy=False):
+    """Parse filepath and return the parser, or None if it does not exist."""
+    parser = GTA_Parser()
+    if parser.read_file(filepath, engine, lazy):
+        return parser
+    return None
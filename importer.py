@@ -1,46 +1,195 @@
 if "bpy" in locals():
     import importlib
     importlib.reload(file_parser)
+    importlib.reload(cache)
+    importlib.reload(resolver)
+    importlib.reload(parallel)
+    importlib.reload(registry)
+    importlib.reload(sources)
+    importlib.reload(skeletons)
+    importlib.reload(materials)
+    importlib.reload(instances)
+    importlib.reload(profiling)
+    importlib.reload(lods)
+    importlib.reload(catalog)
 else:
     from . import file_parser
+    from . import cache
+    from . import resolver
+    from . import parallel
+    from . import registry
+    from . import sources
+    from . import skeletons
+    from . import materials
+    from . import instances
+    from . import profiling
+    from . import lods
+    from . import catalog
 
 import bpy
+import fnmatch
 import os
+import threading
+import numpy as np
 from mathutils import (Vector, Quaternion, Matrix, Euler)
 
 bone_mapping = []
 skeleton = None
 selection = None
-vertexStructures = {
-    "N209731BE": {"pos": 0, "normal": 1, "color": 2, "uv": 3},
-    "N51263BB5": {"pos": 0, "normal": 1, "color": 2, "uv": 3, "undef2": 4},
-    "S9445853F": {"pos": 0, "weights": 1, "bone_indices": 2, "normal": 3, "color": 4, "uv": 5, "undef2": 6},
-    "S12D0183F": {"pos": 0, "weights": 1, "bone_indices": 2, "normal": 3, "color": 4, "undef1": 5, "uv": 6, "uv2": 7, "undef2": 8},
-    "SD7D22350": {"pos": 0, "weights": 1, "bone_indices": 2, "normal": 3, "color": 4, "undef1": 5, "uv": 6, "undef2": 7},
-    "SBED48839": {"pos": 0, "weights": 1, "bone_indices": 2, "normal": 3, "color": 4, "undef1": 5, "uv": 6},
-    "NC794193B": {"pos": 0, "normal": 1, "color": 2, "bone_indices": 3, "uv": 4, "uv2": 5, "undef1": 6},
-    "S1E9F420D": {"pos": 0, "weights": 1, "bone_indices": 2, "normal": 3, "color": 4, "uv": 5}
-
-}
+# vertices before and after welding, summed over one import
+weld_report = [0, 0]
+# finished and total components of the running import
+progress = [0, 0]
+vertexStructures = file_parser.vertexStructures
+# seconds a step waits for a background parse before it yields
+parseWait = 0.005
 
 def getNameFromFile(filepath):
     return os.path.basename(filepath).split(".")[0]
 
 
-def find_in_folder(folder, file_name=None, extension=None):
-    for root, dirs, files in os.walk(folder, topdown=False):
-        for file in files:
-            # print(os.path.join(root, file))
-            if extension:
-                if file.endswith(extension):
-                    return os.path.join(root, file)
-            else:
-                if file.endswith(file_name):
-                    return os.path.join(root, file)
+def fileKeywords(filepath):
+    return {
+        "name": os.path.basename(filepath).split(".")[0],
+        "file_extension": os.path.basename(filepath).split(".")[1],
+        "folder": os.path.dirname(filepath),
+    }
+
+
+def getPatterns(patterns):
+    # "head_*, uppr_*" or a list of patterns
+    if isinstance(patterns, str):
+        patterns = patterns.replace(",", " ").split()
+    return [pattern.lower() for pattern in patterns or []]
+
+
+def useComponent(name, include=(), exclude=()):
+    """Check a component name against include/exclude patterns, case-insensitive.
+
+    Without include patterns everything is included, exclude wins over include.
+    """
+    name = name.lower()
+    if include and not any(fnmatch.fnmatchcase(name, pattern) for pattern in include):
+        return False
+    return not any(fnmatch.fnmatchcase(name, pattern) for pattern in exclude)
+
+
+def readFile(filepath, **kwargs):
+    # files parsed ahead of time, e.g. by worker processes
+    if kwargs.get("parsed"):
+        parser = kwargs["parsed"].get(os.path.normpath(os.path.abspath(filepath)))
+        if parser:
+            return parser
+    parse_cache = cache.getCache(kwargs.get("cache_folder", ""), kwargs.get("cache_size", 0))
+    if parse_cache and os.path.exists(filepath):
+        with profiling.stage("cache load"):
+            parser = parse_cache.load(filepath)
+        if parser:
+            return parser
+    parser = file_parser.GTA_Parser()
+    if parser.read_file(filepath, engine=kwargs.get("parser_engine")):
+        if parse_cache:
+            with profiling.stage("cache store"):
+                parse_cache.store(parser)
+        return parser
     return None
 
 
+def threadSteps(step, function, *args, **kwargs):
+    """Call function on a background thread, yield step until it returns.
+
+    A modal import stays responsive while files are parsed, the parse
+    itself still holds the GIL for most of its time.
+    """
+    result = []
+
+    def run():
+        try:
+            result.append(function(*args, **kwargs))
+        except Exception as error:
+            result.append(error)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(parseWait)
+    while thread.is_alive():
+        yield step
+        thread.join(parseWait)
+    if isinstance(result[0], Exception):
+        raise result[0]
+    return result[0]
+
+
+def readFileSteps(filepath, **kwargs):
+    """readFile on a background thread, yields until the parse is done."""
+    return (yield from threadSteps("parse " + getNameFromFile(filepath), readFile, filepath, **kwargs))
+
+
+def resolveSampler(sampler_name, **kwargs):
+    """Return the image path of a sampler, None if there is nothing to load."""
+    with profiling.stage("texture lookup"):
+        image_path = findSampler(sampler_name, **kwargs)
+    if not image_path:
+        profiling.count("missing textures")
+    return image_path
+
+
+def findSampler(sampler_name, **kwargs):
+    dot_split = sampler_name.split(".")
+    if len(dot_split) > 1:
+        sampler_name = dot_split[0]
+    image_name = sampler_name.lower()
+    image_file = image_name + kwargs["texture_format"]
+    split = image_name.split("\\")
+    image_path = ""
+    path_variants = []
+
+    if not "givemechecker" in image_name and not "*null*" in image_name:
+        if len(split) > 1:
+            image_name = split[1]
+            path_variants.append(os.path.join(kwargs["texture_folder"], split[0], image_name + kwargs["texture_format"]))
+            path_variants.append(os.path.join(kwargs["texture_folder"], image_name + kwargs["texture_format"]))
+            path_variants.append(os.path.join(kwargs["texture_folder"], os.path.pardir, split[0], image_name + kwargs["texture_format"]))
+        else:
+            path_variants.append(os.path.join(kwargs["texture_folder"], image_file))
+            path_variants.append(os.path.join(kwargs["texture_folder"], os.path.pardir, image_file))
+            path_variants.append(os.path.join(kwargs["texture_folder"], os.path.pardir, image_name, image_file))
+
+        for path in path_variants:
+            image_path = kwargs["resolver"].exists(path)
+            if image_path:
+                break
+        if not image_path:
+            image_path = kwargs["resolver"].findFile(kwargs["folder"], file_name=image_name + kwargs["texture_format"])
+
+        if image_path:
+            return image_path
+        else:
+            print('sampler not found! "{0}"'.format(path_variants))
+            return None
+    else:
+        print("no sampler to assign!")
+        return None
+
+
 def getMaterial(shaders, shader_index, mesh_name, create_materials, **kwargs):
+    shader_block = shaders["members"][shader_index]
+
+    # materials are shared by everything with the same textures and parameters
+    samplers = {}
+    for key in ("DiffuseSampler", "BumpSampler", "SpecSampler"):
+        if key in shader_block:
+            samplers[key] = resolveSampler(shader_block[key], **kwargs)
+    parameters = {}
+    if "BumpSampler" in shader_block and shader_block.get("Bumpiness"):
+        parameters["Bumpiness"] = float(shader_block["Bumpiness"])
+    # a texture that was not found is kept by name, other missing textures must not share its material
+    signature = materials.getSignature({key: path or shader_block[key] for key, path in samplers.items()}, parameters)
+
+    if create_materials != "create":
+        mat = materials.findMaterial(signature)
+        if mat is not None:
+            return mat
 
     def getShaderNode(mat):
         shader_node = node_out.inputs['Surface'].links[0].from_node
@@ -50,306 +199,663 @@ def getMaterial(shaders, shader_index, mesh_name, create_materials, **kwargs):
         shaderNode = getShaderNode(mat)
         return shaderNode.inputs[name]
 
-    def getSampler(sampler_name, **kwargs):
-        dot_split = sampler_name.split(".")
-        if len(dot_split) > 1:
-            sampler_name = dot_split[0]
-        image_name = sampler_name.lower()
-        image_file = image_name + kwargs["texture_format"]
-        split = image_name.split("\\")
-        image_path = ""
-        path_variants = []
-
-        if not "givemechecker" in image_name and not "*null*" in image_name:
-            if len(split) > 1:
-                image_name = split[1]
-                path_variants.append(os.path.join(kwargs["texture_folder"], split[0], image_name + kwargs["texture_format"]))
-                path_variants.append(os.path.join(kwargs["texture_folder"], image_name + kwargs["texture_format"]))
-                path_variants.append(os.path.join(kwargs["texture_folder"], os.path.pardir, split[0], image_name + kwargs["texture_format"]))
-            else:
-                path_variants.append(os.path.join(kwargs["texture_folder"], image_file))
-                path_variants.append(os.path.join(kwargs["texture_folder"], os.path.pardir, image_file))
-                path_variants.append(os.path.join(kwargs["texture_folder"], os.path.pardir, image_name, image_file))
-
-            for path in path_variants:
-                if os.path.exists(path):
-                    image_path = path
-                    break
-            if not image_path:
-                image_path = find_in_folder(kwargs["folder"], file_name=image_name + kwargs["texture_format"])
-
-            if image_path:
-                teximage_node = ntree.nodes.new('ShaderNodeTexImage')
-                img = bpy.data.images.load(image_path, check_existing=True)
-                img.name = kwargs["name"]+ "_" + image_name
-                teximage_node.image = img
-                return teximage_node
-            else:
-                print('sampler not found! "{0}"'.format(path_variants))
-                return None
-        else:
-            print("no sampler to assign!")
+    def getSampler(key):
+        if not samplers.get(key):
+            return None
+        teximage_node = ntree.nodes.new('ShaderNodeTexImage')
+        teximage_node.image = materials.loadImage(samplers[key])
+        return teximage_node
 
-    # Get material
+    # create material
     mat_name = kwargs["name"]+ "_" + mesh_name + str(shader_index)
-    mat = bpy.data.materials.get(mat_name)
-
-    if mat is None or create_materials == "create":
-        # create material
-        mat = bpy.data.materials.new(name=mat_name)
-        mat.use_nodes = True
-
-        ntree = mat.node_tree
-        node_out = ntree.get_output_node('EEVEE')
-        shader = getShaderNode(mat)
-        links = ntree.links
-        # add diffuse map
-        colorInput = getShaderInput(mat, 'Base Color')
-        if "DiffuseSampler" in shaders["members"][shader_index]:
-            teximage_node = getSampler(shaders["members"][shader_index]["DiffuseSampler"], **kwargs)
-            if teximage_node:
-                teximage_node.interpolation = 'Smart'
-
-                # blend mode
-                # mat.blend_method = 'CLIP'
-                # mat.shadow_method = 'CLIP'
-
-                links.new(teximage_node.outputs['Color'],colorInput)
-                links.new(teximage_node.outputs[1], shader.inputs["Alpha"])
-
-
-        # add normal map
-        if "BumpSampler" in shaders["members"][shader_index]:
-            teximage_node = getSampler(shaders["members"][shader_index]["BumpSampler"], **kwargs)
-            if teximage_node:
-                teximage_node.interpolation = 'Smart'
-                normalMap_node = ntree.nodes.new('ShaderNodeNormalMap')
-                if shaders["members"][shader_index]["Bumpiness"]:
-                    normalMap_node.inputs[0].default_value = float(shaders["members"][shader_index]["Bumpiness"])
-
-                teximage_node.image.colorspace_settings.name = 'Raw'
-
-                # invert greenchannel
-                seperateRGB = ntree.nodes.new("ShaderNodeSeparateRGB")
-                links.new(teximage_node.outputs['Color'], seperateRGB.inputs[0])
-
-                invertNode = ntree.nodes.new("ShaderNodeInvert")
-                links.new(seperateRGB.outputs[1], invertNode.inputs[1])
-                combineRGB = ntree.nodes.new("ShaderNodeCombineRGB")
-                links.new(invertNode.outputs[0], combineRGB.inputs[1])
-                links.new(seperateRGB.outputs[0], combineRGB.inputs[0])
-                links.new(seperateRGB.outputs[2], combineRGB.inputs[2])
-
-                links.new(combineRGB.outputs[0], normalMap_node.inputs['Color'])
-                links.new(normalMap_node.outputs['Normal'], shader.inputs['Normal'])
-
-        # add specular map
-        if "SpecSampler" in shaders["members"][shader_index]:
-            teximage_node = getSampler(shaders["members"][shader_index]["SpecSampler"], **kwargs)
-            if teximage_node:
-                teximage_node.interpolation = 'Smart'
-                seperateRGB = ntree.nodes.new("ShaderNodeSeparateRGB")
-                links.new(teximage_node.outputs['Color'], seperateRGB.inputs[0])
-                links.new(seperateRGB.outputs[2], shader.inputs[5])
-
+    mat = bpy.data.materials.new(name=mat_name)
+    mat.use_nodes = True
+
+    ntree = mat.node_tree
+    node_out = ntree.get_output_node('EEVEE')
+    shader = getShaderNode(mat)
+    links = ntree.links
+    # add diffuse map
+    colorInput = getShaderInput(mat, 'Base Color')
+    teximage_node = getSampler("DiffuseSampler")
+    if teximage_node:
+        teximage_node.interpolation = 'Smart'
+
+        # blend mode
+        # mat.blend_method = 'CLIP'
+        # mat.shadow_method = 'CLIP'
+
+        links.new(teximage_node.outputs['Color'],colorInput)
+        links.new(teximage_node.outputs[1], shader.inputs["Alpha"])
+
+    # add normal map
+    teximage_node = getSampler("BumpSampler")
+    if teximage_node:
+        teximage_node.interpolation = 'Smart'
+        normalMap_node = ntree.nodes.new('ShaderNodeNormalMap')
+        if "Bumpiness" in parameters:
+            normalMap_node.inputs[0].default_value = parameters["Bumpiness"]
+
+        teximage_node.image.colorspace_settings.name = 'Raw'
+
+        # invert greenchannel
+        invertGreen = ntree.nodes.new("ShaderNodeGroup")
+        invertGreen.node_tree = materials.getInvertGreenGroup()
+        links.new(teximage_node.outputs['Color'], invertGreen.inputs[0])
+
+        links.new(invertGreen.outputs[0], normalMap_node.inputs['Color'])
+        links.new(normalMap_node.outputs['Normal'], shader.inputs['Normal'])
+
+    # add specular map
+    teximage_node = getSampler("SpecSampler")
+    if teximage_node:
+        teximage_node.interpolation = 'Smart'
+        seperateRGB = ntree.nodes.new("ShaderNodeSeparateRGB")
+        links.new(teximage_node.outputs['Color'], seperateRGB.inputs[0])
+        links.new(seperateRGB.outputs[2], shader.inputs[5])
+
+    materials.registerMaterial(mat, signature)
+    return mat
 
 
-    return mat
+def createMesh(name, positions, faces):
+    # fill the mesh straight from the parser arrays
+    mesh = bpy.data.meshes.new(name)
+    num_faces = len(faces)
+    mesh.vertices.add(len(positions))
+    mesh.vertices.foreach_set("co", np.ascontiguousarray(positions, dtype=np.float32).ravel())
+    mesh.loops.add(num_faces * 3)
+    mesh.loops.foreach_set("vertex_index", np.ascontiguousarray(faces, dtype=np.int32).ravel())
+    mesh.polygons.add(num_faces)
+    mesh.polygons.foreach_set("loop_start", np.arange(0, num_faces * 3, 3, dtype=np.int32))
+    # newer Blender versions derive loop_total from loop_start
+    if not bpy.types.MeshPolygon.bl_rna.properties["loop_total"].is_readonly:
+        mesh.polygons.foreach_set("loop_total", np.full(num_faces, 3, dtype=np.int32))
+    mesh.update(calc_edges=True)
+    return mesh
+
+
+def addColorLayer(mesh, name, colors, loop_vertices, per_loop=False):
+    # colors are stored per vertex in the file, so keep them on the point
+    # domain where the attribute API is available. Welded meshes pass one
+    # color per loop. Like the byte vertex color layers used before, values
+    # are clamped to 0..1 and taken as sRGB.
+    rgba = np.ones((len(colors), 4), dtype=np.float32)
+    rgba[:, :min(colors.shape[1], 4)] = colors[:, :4]
+    np.clip(rgba, 0.0, 1.0, out=rgba)
+    domain = 'CORNER' if per_loop else 'POINT'
+    if hasattr(mesh, "color_attributes"):
+        layer = mesh.color_attributes.new(name=name, type='BYTE_COLOR', domain=domain)
+    elif hasattr(mesh, "attributes"):
+        layer = mesh.attributes.new(name=name, type='BYTE_COLOR', domain=domain)
+    else:
+        layer = mesh.vertex_colors.new(name=name)
+        if not per_loop:
+            rgba = rgba[loop_vertices]
+        layer.data.foreach_set("color", rgba.ravel())
+        return layer
+    if "color_srgb" in bpy.types.ByteColorAttributeValue.bl_rna.properties:
+        layer.data.foreach_set("color_srgb", rgba.ravel())
+    else:
+        # color of byte attributes is linear
+        rgb = rgba[:, :3]
+        rgba[:, :3] = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+        layer.data.foreach_set("color", rgba.ravel())
+    return layer
 
 
-def setVertexAttributes(Obj, mesh, VertexData, VertexDeclaration, skinned):
+def getVertexGroups(Obj, bone_indices):
+    # index -> vertex group table, groups are created in order of appearance
     global bone_mapping
+    groups = [None] * len(bone_mapping)
+    for bone_index in bone_indices:
+        if bone_index >= len(bone_mapping):
+            print("bone index {0} out of range for {1} bones".format(bone_index, len(bone_mapping)))
+            continue
+        vg_name = bone_mapping[bone_index]
+        group = Obj.vertex_groups.get(vg_name)
+        if group is None:
+            group = Obj.vertex_groups.new(name=vg_name)
+        groups[bone_index] = group
+    return groups
+
+
+def setSkinWeights(Obj, mesh, bone_data, weight_data, loop_vertices, max_influences=0, normalize_weights=False):
+    vertices = np.unique(loop_vertices)
+    bones = bone_data[vertices].astype(np.int64)
+    weights = weight_data[vertices].astype(np.float32)
+
+    # optional influence limiting and normalization
+    if 0 < max_influences < bones.shape[1]:
+        order = np.argsort(-weights, axis=1, kind="stable")[:, :max_influences]
+        bones = np.take_along_axis(bones, order, axis=1)
+        weights = np.take_along_axis(weights, order, axis=1)
+    if normalize_weights:
+        totals = weights.sum(axis=1, keepdims=True)
+        np.divide(weights, totals, out=weights, where=totals > 0.0)
+
+    flat_bones = bones.ravel()
+    unique_bones, first = np.unique(flat_bones, return_index=True)
+    groups = getVertexGroups(Obj, unique_bones[np.argsort(first)].tolist())
+
+    # one (vertex, bone) pair per influence, the last positive weight wins
+    flat_vertices = np.repeat(vertices, bones.shape[1])
+    flat_weights = weights.ravel()
+    positive = flat_weights > 0.0
+    flat_vertices = flat_vertices[positive][::-1]
+    flat_bones = flat_bones[positive][::-1]
+    flat_weights = flat_weights[positive][::-1]
+    _, keep = np.unique(flat_vertices.astype(np.int64) * (len(groups) + 1) + flat_bones, return_index=True)
+    flat_vertices = flat_vertices[keep]
+    flat_bones = flat_bones[keep]
+    flat_weights = flat_weights[keep]
+
+    # one add per distinct weight of every group
+    order = np.lexsort((flat_weights, flat_bones))
+    flat_vertices = flat_vertices[order]
+    flat_bones = flat_bones[order]
+    flat_weights = flat_weights[order]
+    splits = np.flatnonzero((np.diff(flat_bones) != 0) | (np.diff(flat_weights) != 0)) + 1
+    for start, end in zip(np.concatenate(([0], splits)), np.concatenate((splits, [len(flat_bones)]))):
+        if start == end:
+            continue
+        bone_index = flat_bones[start]
+        if bone_index < len(groups) and groups[bone_index]:
+            groups[bone_index].add(flat_vertices[start:end].tolist(), float(flat_weights[start]), 'REPLACE')
+
+
+# vertex colors: attribute of the vertex declaration -> (layer name, scale)
+colorLayers = (("color", "color1", 1 / 256), ("undef1", "color2", 1 / 256), ("undef2", "color3", 1.0))
+# value of attributes a geometry does not have, after joining
+attributeDefaults = {"color": 1.0, "undef1": 1.0, "undef2": 1.0}
+
+
+def getGeometryArrays(geometry):
+    """Return the faces and the per-vertex attribute arrays of a geometry."""
+    vertex_block = file_parser.getChild(geometry, "Vertices")
+    structure = vertexStructures[geometry["VertexDeclaration"]]
+    attributes = {}
+    for key, group_index in structure.items():
+        attributes[key] = file_parser.getVertexAttribute(vertex_block, group_index)
+    for key, layer_name, scale in colorLayers:
+        if key in attributes and scale != 1.0:
+            attributes[key] = attributes[key] * scale
+    return file_parser.getChild(geometry, "Indices")["faces"], attributes
+
+
+def assembleGeometries(geometries, name=""):
+    """Concatenate the geometries of a mesh file into one vertex/face set.
+
+    Face indices are offset by the vertices of the previous geometries and
+    every face gets the material slot of its geometry's ShaderIndex, slots
+    in order of appearance. Attributes missing in some geometries are filled
+    with attributeDefaults (0 otherwise). Geometries with faces pointing
+    outside of their vertices are skipped, like a failed mesh.validate did.
+    """
+    parts = []
+    shader_slots = []
+    for num, geometry in enumerate(geometries):
+        faces, attributes = getGeometryArrays(geometry)
+        vertex_count = len(attributes["pos"])
+        if faces.size and (faces.min() < 0 or faces.max() >= vertex_count):
+            print('mesh validation failed for: "{0}"'.format(name + str(num)))
+            continue
+        shader_index = int(geometry["ShaderIndex"])
+        if shader_index not in shader_slots:
+            shader_slots.append(shader_index)
+        parts.append((faces, attributes, shader_slots.index(shader_index)))
+
+    keys = []
+    for faces, attributes, slot in parts:
+        keys.extend(key for key in attributes if key not in keys)
+
+    result = {"faces": [], "material_indices": [], "attributes": {}, "shader_slots": shader_slots}
+    offset = 0
+    for faces, attributes, slot in parts:
+        result["faces"].append(faces + offset)
+        result["material_indices"].append(np.full(len(faces), slot, dtype=np.int32))
+        offset += len(attributes["pos"])
+    for key in keys:
+        width = max(attributes[key].shape[1] for faces, attributes, slot in parts if key in attributes)
+        columns = []
+        for faces, attributes, slot in parts:
+            column = np.full((len(attributes["pos"]), width), attributeDefaults.get(key, 0.0), dtype=np.float32)
+            if key in attributes:
+                column[:, :attributes[key].shape[1]] = attributes[key]
+            columns.append(column)
+        result["attributes"][key] = np.concatenate(columns) if columns else np.zeros((0, width), dtype=np.float32)
+
+    result["faces"] = np.concatenate(result["faces"]) if parts else np.zeros((0, 3), dtype=np.int32)
+    result["material_indices"] = np.concatenate(result["material_indices"]) if parts else np.zeros(0, dtype=np.int32)
+    result["positions"] = result["attributes"].get("pos", np.zeros((0, 3), dtype=np.float32))
+    return result
+
+
+def weldVertices(assembled, skinned):
+    """Merge vertices with identical positions (and skin weights when skinned).
+
+    Positions and skin data are replaced by one entry per welded vertex and
+    the faces are remapped. All other attributes stay per source vertex,
+    loop_sources keeps the source vertex of every loop so they can be
+    written per loop, vertex_sources the first source vertex of every
+    welded vertex. Faces that collapse or that use the same three
+    vertices as an earlier face are dropped, mesh.validate would remove
+    them later and the loops would no longer match loop_sources.
+    """
+    attributes = assembled["attributes"]
+    # + 0.0 turns -0.0 into 0.0 so both hash the same
+    columns = [attributes["pos"][:, :3] + np.float32(0.0)]
+    if skinned:
+        columns += [attributes["weights"], attributes["bone_indices"]]
+    keys = np.ascontiguousarray(np.concatenate(columns, axis=1), dtype=np.float32)
+    keys = keys.view(np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))).ravel()
+    _, first, remap = np.unique(keys, return_index=True, return_inverse=True)
+    remap = remap.ravel()
+
+    faces = remap[assembled["faces"]]
+    keep = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])
+    keep = np.flatnonzero(keep)
+    if len(keep):
+        _, unique = np.unique(np.sort(faces[keep], axis=1), axis=0, return_index=True)
+        keep = keep[np.sort(unique)]
+    welded = dict(assembled)
+    welded["faces"] = faces[keep].astype(np.int32)
+    welded["material_indices"] = assembled["material_indices"][keep]
+    welded["loop_sources"] = assembled["faces"][keep].ravel()
+    welded["vertex_sources"] = first
+    welded["positions"] = attributes["pos"][first]
+    welded["attributes"] = dict(attributes)
+    for key in ("pos", "weights", "bone_indices"):
+        if key in attributes:
+            welded["attributes"][key] = attributes[key][first]
+    return welded
+
+
+def setVertexAttributes(Obj, mesh, attributes, skinned, loop_sources=None, vertex_sources=None, **kwargs):
+    # loop -> vertex mapping, every attribute is gathered through it
+    loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_vertices)
+    # welded meshes read uvs, colors and normals from the source vertex of each loop
+    per_loop = loop_sources is not None
+    if per_loop and len(loop_sources) != len(loop_vertices):
+        print('welded loops do not match the mesh of "{0}", attributes are read per vertex'.format(mesh.name))
+        per_loop = False
+        # the other attributes are still per source vertex, take the first one of every welded vertex
+        attributes = {key: value if key in ("pos", "weights", "bone_indices") else value[vertex_sources]
+                      for key, value in attributes.items()}
+    sources = loop_sources if per_loop else loop_vertices
+
+    # set uv coordinates, flip y axis
+    uvs = attributes["uv"][sources, :2].astype(np.float32)
+    uvs[:, 1] = 1 - uvs[:, 1]
     mesh.uv_layers.new(name="UVMap")
-    uvlayer = mesh.uv_layers.active.data
-    mesh.calc_loop_triangles()
-    normals = []
-    vcolor1 = None
-    vcolor2 = None
-    vcolor3 = None
-    # get vertex mapping
-    normalIndex = vertexStructures[VertexDeclaration]["normal"]
-    uvIndex = vertexStructures[VertexDeclaration]["uv"]
+    mesh.uv_layers.active.data.foreach_set("uv", uvs.ravel())
+
+    for key, layer_name, scale in colorLayers:
+        if key in attributes:
+            colors = attributes[key][sources] if per_loop else attributes[key]
+            addColorLayer(mesh, layer_name, colors, loop_vertices, per_loop)
+
+    # add bone weights
     if skinned:
-        boneIndex = vertexStructures[VertexDeclaration]["bone_indices"]
-        weightIndex = vertexStructures[VertexDeclaration]["weights"]
-    if "color" in vertexStructures[VertexDeclaration]:
-        vcolor1 = mesh.vertex_colors.new(name="color1")
-    if "undef1" in vertexStructures[VertexDeclaration]:
-        vcolor2 = mesh.vertex_colors.new(name="color2")
-    if "undef2" in vertexStructures[VertexDeclaration]:
-        vcolor3 = mesh.vertex_colors.new(name="color3")
-
-    for i, lt in enumerate(mesh.loop_triangles):
-        for loop_index in lt.loops:
-            # set uv coordinates
-            uvlayer[loop_index].uv = VertexData[mesh.loops[loop_index].vertex_index][uvIndex]
-            # flip y axis
-            uvlayer[loop_index].uv[1] = 1 - uvlayer[loop_index].uv[1]
-            # set normals (1)
-            normals.append(VertexData[mesh.loops[loop_index].vertex_index][normalIndex])
-            # add bone weights
-            if skinned:
-                # bone indices (4)
-                for i, vg in enumerate(VertexData[mesh.loops[loop_index].vertex_index][boneIndex]):
-                    vg_name = bone_mapping[int(vg)]
-                    if not vg_name in Obj.vertex_groups:
-                        group = Obj.vertex_groups.new(name=vg_name)
-                    else:
-                        group = Obj.vertex_groups[vg_name]
-                    # bone weights (3)
-                    weight = VertexData[mesh.loops[loop_index].vertex_index][weightIndex][i]
-                    if weight > 0.0:
-                        group.add([mesh.loops[loop_index].vertex_index], weight, 'REPLACE' )
-            if vcolor1:
-                vcolor1.data[loop_index].color = VertexData[mesh.loops[loop_index].vertex_index][vertexStructures[VertexDeclaration]["color"]]/256
-            if vcolor2:
-                vcolor2.data[loop_index].color = VertexData[mesh.loops[loop_index].vertex_index][vertexStructures[VertexDeclaration]["undef1"]]/256
-            if vcolor3:
-                vcolor3.data[loop_index].color = VertexData[mesh.loops[loop_index].vertex_index][vertexStructures[VertexDeclaration]["undef2"]]
+        with profiling.stage("skin weights"):
+            setSkinWeights(Obj, mesh, attributes["bone_indices"], attributes["weights"], loop_vertices,
+                kwargs.get("max_influences", 0), kwargs.get("normalize_weights", False))
 
     # normal custom verts
-    mesh.use_auto_smooth = True
-    mesh.normals_split_custom_set(normals)
-
+    with profiling.stage("custom normals"):
+        mesh.use_auto_smooth = True
+        if per_loop:
+            mesh.normals_split_custom_set(np.ascontiguousarray(attributes["normal"][sources, :3]))
+        else:
+            mesh.normals_split_custom_set_from_vertices(np.ascontiguousarray(attributes["normal"][:, :3]))
 
 
 def findArmature(skel_file):
-    # try to get the existing armature by name
+    # reuse an armature built from the same .skel file
     global skeleton, bone_mapping, selection
-    skel_name = os.path.basename(skel_file).split(".")[0]
-
-    def findArmatureFromList(objectList):
-        global skeleton
-        for obj in objectList:
-            if skel_name in obj.name and obj.type == 'ARMATURE':
-                skeleton = obj
-                for bone in skeleton.pose.bones:
-                    bone_mapping.append(bone.name)
-                return True
-        return False
-
-    # first check selection
-    if not findArmatureFromList(selection):
-        # then all objects
-        return findArmatureFromList(bpy.data.objects)
-    else:
+    obj = skeletons.findArmature(skel_file, selection)
+    if obj:
+        skeleton = obj
+        bone_mapping = skeletons.getBoneMapping(obj)
         return True
+    return False
+
+
+def findSkeleton(filepath, import_armature, **kwargs):
+    # find skelton
+    root = None
+    if "odd_root" in kwargs:
+        root = kwargs["odd_root"]
+    elif "odr_root" in kwargs:
+        root = kwargs["odr_root"]
+    if not skeleton and root:
+        skel_file = kwargs["resolver"].findFile(root, extension=".skel")
+        if skel_file:
+            if import_armature == "create" or not findArmature(skel_file):
+                loadSkeleton(skel_file, **kwargs)
+        if not skeleton:
+            print("no skeleton file or armature found for: {0}".format(filepath))
+    return skeleton is not None
+
+
+def addObject(Obj, skinned_mesh):
+    bpy.context.scene.collection.objects.link(Obj)
+    bpy.context.view_layer.objects.active = Obj
+
+    # apply armature modifier
+    if skinned_mesh and skeleton:
+        mod = Obj.modifiers.new("armature", 'ARMATURE')
+        if mod:
+            mod.object = skeleton
+            Obj.parent = skeleton
+
+    Obj.select_set(False)
+    return Obj
+
+
+def runSteps(steps):
+    """Run an import step generator to its end and return its result."""
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
 
 
 def importMesh(filepath, shaders, import_armature, skinned=False, create_materials=False, **kwargs):
+    return runSteps(importMeshSteps(filepath, shaders, import_armature, skinned, create_materials, **kwargs))
+
+
+def importMeshSteps(filepath, shaders, import_armature, skinned=False, create_materials=False, **kwargs):
     global skeleton, bone_mapping
-    p = file_parser.GTA_Parser()
-    p.read_file(filepath)
     base_name = getNameFromFile(filepath)
 
-    objects = []
-    for num, geometry in enumerate(p.data["members"][0]["members"][1]["members"]):
-        name = base_name + str(num)
-        faces = geometry["members"][0]["faces"]
-        verts = geometry["members"][1]["positions"]
-        shader_index = int(geometry["ShaderIndex"])
-        skinned_mesh = p.data["members"][0]["Skinned"] == "True" and import_armature != "no"
-        bone_count = int(p.data["members"][0]["BoneCount"])
-
-        mesh = bpy.data.meshes.new(name)
-        mesh.from_pydata(verts, (), faces)
-
-        # find skelton
-        root = None
-        if "odd_root" in kwargs:
-            root = kwargs["odd_root"]
-        elif "odr_root" in kwargs:
-            root = kwargs["odr_root"]
-        if skinned_mesh and not skeleton and root:
-            skel_file = find_in_folder(root, extension=".skel")
-            if skel_file:
-                if import_armature == "create" or not findArmature(skel_file):
-                    loadSkeleton(skel_file, **kwargs)
-            if not skeleton:
-                skinned_mesh = False
-                print("no skeleton file or armature found for: {0}".format(filepath))
-
-        if not mesh.validate(verbose=True):
-            VertexDeclaration = geometry["VertexDeclaration"]
-            Obj = bpy.data.objects.new(name, mesh)
-            setVertexAttributes(Obj, mesh, geometry["members"][1]["vertices"], VertexDeclaration, skinned_mesh)
-            bpy.context.scene.collection.objects.link(Obj)
-            Obj.select_set(True)
-            objects.append(Obj)
-            bpy.context.view_layer.objects.active = Obj
-            if create_materials != "no":
-                # Assign material to object
-                mat = getMaterial(shaders, shader_index, base_name, create_materials, **kwargs)
-                Obj.data.materials.append(mat)
-        else:
-            print('mesh validation failed for: "{0}"'.format(name))
+    # link the mesh data of an earlier import of the same file
+    instance_key = None
+    if not kwargs.get("unique_meshes") and os.path.exists(filepath):
+        instance_key = instances.getKey(filepath, shaders, create_materials=create_materials, **kwargs)
+        # "create" asks for new materials, they live on the mesh data
+        mesh = instances.findMesh(instance_key) if create_materials != "create" else None
+        if mesh is not None:
+            skinned_mesh = mesh[instances.SKINNED_PROPERTY] and import_armature != "no"
+            if skinned_mesh:
+                skinned_mesh = findSkeleton(filepath, import_armature, **kwargs)
+            if skinned_mesh == mesh[instances.WEIGHTED_PROPERTY]:
+                profiling.count("mesh instances")
+                Obj = addObject(instances.newInstance(base_name, mesh), skinned_mesh)
+                sources.recordMesh(Obj, filepath, kwargs.get("odr_path"), import_armature=import_armature,
+                                   create_materials=create_materials, **kwargs)
+                return Obj
+
+    p = yield from readFileSteps(filepath, **kwargs)
+    if not p:
+        return None
+    yield "parse " + base_name
+
+    skinned_file = p.getMemberByName("Skinned") == "True"
+    skinned_mesh = skinned_file and import_armature != "no"
+    if skinned_mesh:
+        skinned_mesh = findSkeleton(filepath, import_armature, **kwargs)
 
-    if bpy.context.view_layer.objects.active:
-        # join all submeshes
-        if len(objects) > 1:
-            bpy.ops.object.join()
+    Obj = yield from buildMeshSteps(p, base_name, shaders, skinned_mesh, create_materials, **kwargs)
+    if Obj is None:
+        return None
+    if instance_key:
+        instances.registerMesh(Obj.data, instance_key, Obj.vertex_groups, skinned_file, skinned_mesh)
+
+    addObject(Obj, skinned_mesh)
+    sources.recordMesh(Obj, filepath, kwargs.get("odr_path"), import_armature=import_armature,
+                       create_materials=create_materials, **kwargs)
+    return Obj
 
-        bpy.context.view_layer.objects.active.name = base_name
-        activeObject = bpy.context.view_layer.objects.active
 
-        # apply armature modifier
-        if skinned_mesh and skeleton and activeObject:
-            mod = activeObject.modifiers.new("armature", 'ARMATURE')
-            if mod:
-                mod.object = skeleton
-                activeObject.parent = skeleton
+def buildMesh(p, base_name, shaders, skinned_mesh, create_materials, Obj=None, **kwargs):
+    """Build the mesh data of a parsed .mesh file.
 
-        activeObject.select_set(False)
-        return activeObject
-    else:
+    Returns a new object with the mesh, or Obj showing the new mesh when it
+    is given. None if the file has no faces.
+    """
+    return runSteps(buildMeshSteps(p, base_name, shaders, skinned_mesh, create_materials, Obj, **kwargs))
+
+
+def buildMeshSteps(p, base_name, shaders, skinned_mesh, create_materials, Obj=None, **kwargs):
+    geometries = p.getMemberByName("Geometries")
+
+    # all geometries go into one mesh, one material slot per shader
+    with profiling.stage("assemble geometry"):
+        assembled = assembleGeometries(geometries["members"] if geometries else [], base_name)
+    if not len(assembled["faces"]):
         return None
+    if kwargs.get("weld_vertices"):
+        vertex_count = len(assembled["positions"])
+        with profiling.stage("weld vertices"):
+            assembled = weldVertices(assembled, skinned_mesh)
+        weld_report[0] += vertex_count
+        weld_report[1] += len(assembled["positions"])
+        print("welded {0}: {1} -> {2} vertices".format(base_name, vertex_count, len(assembled["positions"])))
+    yield "assemble " + base_name
+    with profiling.stage("create mesh"):
+        mesh = createMesh(base_name, assembled["positions"], assembled["faces"])
+        mesh.polygons.foreach_set("material_index", assembled["material_indices"])
+        mesh[sources.SLOTS_PROPERTY] = assembled["shader_slots"]
+    with profiling.stage("validate"):
+        if mesh.validate(verbose=True):
+            print('mesh validation corrected: "{0}"'.format(base_name))
+    profiling.count("meshes")
+    profiling.count("vertices", len(mesh.vertices))
+    profiling.count("loops", len(mesh.loops))
+    yield "create mesh " + base_name
+
+    # vertex groups write their weights into the object's current mesh data
+    if Obj is None:
+        Obj = bpy.data.objects.new(base_name, mesh)
+    else:
+        Obj.data = mesh
+    with profiling.stage("vertex attributes"):
+        setVertexAttributes(Obj, mesh, assembled["attributes"], skinned_mesh, assembled.get("loop_sources"),
+                            assembled.get("vertex_sources"), **kwargs)
+    if create_materials != "no":
+        for shader_index in assembled["shader_slots"]:
+            yield "materials " + base_name
+            with profiling.stage("materials"):
+                mat = getMaterial(shaders, shader_index, base_name, create_materials, **kwargs)
+            mesh.materials.append(mat)
+    return Obj
+
+
+def importLODs(lodgroup, name, shaders, import_armature, create_materials=False, **kwargs):
+    """Import the cheapest LOD right away and stream in the requested one.
+
+    The requested LOD is parsed in a background thread and swapped into
+    the object's mesh data when it is ready. With keep_lods every LOD is
+    loaded and kept as mesh data that can be switched to later.
+    """
+    mesh_paths = file_parser.getMeshPaths(lodgroup, name, kwargs["folder"])
+    requested = file_parser.getMeshPath(lodgroup, name, kwargs["LOD"], kwargs["folder"])
+    first_lod, first_path = mesh_paths[-1]
+    Obj = importMesh(first_path, shaders, import_armature, create_materials=create_materials, **dict(kwargs, LOD=first_lod))
+    if Obj is None or first_path == requested and not kwargs.get("keep_lods"):
+        return Obj
+    Obj.name = getNameFromFile(requested)
+    Obj[lods.ACTIVE_PROPERTY] = first_lod
+    if kwargs.get("keep_lods"):
+        lods.keepLOD(Obj, first_lod, Obj.data)
+        jobs = [(lod, path) for lod, path in reversed(mesh_paths[:-1])]
+        # the requested LOD first, it is the one that gets shown
+        jobs.sort(key=lambda job: job[1] != requested)
+    else:
+        jobs = [(lod, path) for lod, path in mesh_paths if path == requested][:1]
+    if not jobs:
+        return Obj
+
+    # the globals belong to this import, later imports may replace them
+    mapping = bone_mapping
+    armature = skeleton
+
+    def findLOD(lod, path):
+        """Mesh data of an earlier import of this LOD, None when it has to be built."""
+        if kwargs.get("unique_meshes") or create_materials == "create":
+            return None
+        mesh = instances.findMesh(instances.getKey(path, shaders, create_materials=create_materials, **dict(kwargs, LOD=lod)))
+        if mesh is None:
+            return None
+        skinned_mesh = mesh[instances.SKINNED_PROPERTY] and import_armature != "no" and armature is not None
+        return mesh if skinned_mesh == mesh[instances.WEIGHTED_PROPERTY] else None
+
+    def useLOD(Obj, lod, path, mesh, shown):
+        if kwargs.get("keep_lods"):
+            lods.keepLOD(Obj, lod, mesh)
+        if path == requested:
+            lods.showLOD(Obj, lod, mesh)
+            instances.addVertexGroups(Obj, mesh)
+            sources.recordMesh(Obj, path, kwargs.get("odr_path"), import_armature=import_armature,
+                               create_materials=create_materials, **dict(kwargs, LOD=lod))
+            print("loaded {0} LOD of {1}".format(lod, Obj.name))
+            # the replaced LOD is not kept or linked anywhere else
+            if shown is not mesh and shown.users == 0:
+                bpy.data.meshes.remove(shown)
+        else:
+            Obj.data = shown
+
+    # LODs imported before are linked, only the others are parsed
+    pending = []
+    for lod, path in jobs:
+        mesh = findLOD(lod, path)
+        if mesh is None:
+            pending.append((lod, path))
+        else:
+            profiling.count("mesh instances")
+            useLOD(Obj, lod, path, mesh, Obj.data)
+    jobs = pending
+    if not jobs:
+        return Obj
+
+    def parse(path):
+        return readFile(path, **kwargs)
+
+    def build(Obj, lod, path, p):
+        global bone_mapping, skeleton
+        shown = Obj.data
+        # another import may have built the LOD while it was parsed
+        mesh = findLOD(lod, path)
+        if mesh is not None:
+            profiling.count("mesh instances")
+            useLOD(Obj, lod, path, mesh, shown)
+            return
+        saved = (bone_mapping, skeleton)
+        bone_mapping, skeleton = mapping, armature
+        try:
+            skinned_file = p.getMemberByName("Skinned") == "True"
+            skinned_mesh = skinned_file and import_armature != "no" and armature is not None
+            built = buildMesh(p, getNameFromFile(path), shaders, skinned_mesh, create_materials, Obj, **dict(kwargs, LOD=lod))
+        finally:
+            bone_mapping, skeleton = saved
+        if built is None:
+            return
+        mesh = Obj.data
+        if not kwargs.get("unique_meshes"):
+            key = instances.getKey(path, shaders, create_materials=create_materials, **dict(kwargs, LOD=lod))
+            instances.registerMesh(mesh, key, Obj.vertex_groups, skinned_file, skinned_mesh)
+        useLOD(Obj, lod, path, mesh, shown)
+
+    lods.stream(Obj, jobs, parse, build)
+    return Obj
+
+
+def getBoneTransforms(root_bone):
+    """Walk the bone tree and compute every bone's armature space matrix.
+
+    Bones are listed depth first, in the order the recursive build used, so
+    parents always come before their children. Returns the bone names, the
+    parent index of every bone (-1 for the root) and an (N, 4, 4) array of
+    matrices: the local matrix is the LocalOffset translation times the
+    RotationQuaternion rotation, multiplied onto the parent's matrix.
+    """
+    names = []
+    parents = []
+    rotations = []
+    offsets = []
+    stack = [(root_bone, -1)]
+    while stack:
+        bone, parent = stack.pop()
+        index = len(names)
+        names.append(bone["attributes"][0])
+        parents.append(parent)
+        rotations.append(bone["RotationQuaternion"])
+        offsets.append(bone["LocalOffset"])
+        children = [child for block in bone["members"] for child in block["members"]]
+        stack.extend((child, index) for child in reversed(children))
+
+    # quaternions are stored as x y z w
+    x, y, z, w = np.array(rotations, dtype=np.float64).T
+    local = np.zeros((len(names), 4, 4))
+    local[:, 0, 0] = 1 - 2 * (y * y + z * z)
+    local[:, 0, 1] = 2 * (x * y - w * z)
+    local[:, 0, 2] = 2 * (x * z + w * y)
+    local[:, 1, 0] = 2 * (x * y + w * z)
+    local[:, 1, 1] = 1 - 2 * (x * x + z * z)
+    local[:, 1, 2] = 2 * (y * z - w * x)
+    local[:, 2, 0] = 2 * (x * z - w * y)
+    local[:, 2, 1] = 2 * (y * z + w * x)
+    local[:, 2, 2] = 1 - 2 * (x * x + y * y)
+    local[:, :3, 3] = np.array(offsets, dtype=np.float64)
+    local[:, 3, 3] = 1
+
+    # one batched multiplication per tree level
+    parents = np.array(parents, dtype=np.int64)
+    depth = np.zeros(len(names), dtype=np.int64)
+    for index in range(1, len(names)):
+        depth[index] = depth[parents[index]] + 1
+    matrices = local.copy()
+    for level in range(1, depth.max() + 1 if len(names) else 0):
+        bones = np.flatnonzero(depth == level)
+        matrices[bones] = matrices[parents[bones]] @ local[bones]
+    return names, parents, matrices
 
 
 def buildArmature(skel_file):
+    global bone_mapping
     arma = bpy.data.armatures.new(os.path.basename(skel_file.name))
     Obj = bpy.data.objects.new(os.path.basename(skel_file.name), arma)
     bpy.context.scene.collection.objects.link(Obj)
-    bpy.context.view_layer.objects.active = Obj
-    bpy.ops.object.mode_set(mode='EDIT', toggle=False)
+    bone_mapping.extend(buildBones(Obj, skel_file))
+    return Obj
 
-    numBones = skel_file.data["members"][0]["NumBones"]
 
-    def addBone(bone, armature, obj, parent=None):
-        global bone_mapping
+def buildBones(Obj, skel_file):
+    """Add the bones of a parsed .skel file to the armature object, returns their names."""
+    arma = Obj.data
+    bpy.context.view_layer.objects.active = Obj
+    names, parents, matrices = getBoneTransforms(skel_file.data["members"][0]["members"][0])
 
-        bone_name = bone["attributes"][0]
-        bone_mapping.append(bone_name)
-        b_bone = armature.edit_bones.new(bone_name)
-        b_bone.head = (0,0,0)
-        b_bone.tail = (0,0.05,0)
+    # create every bone in one edit mode pass, nothing is read back
+    bpy.ops.object.mode_set(mode='EDIT', toggle=False)
+    edit_bones = []
+    for name, parent, matrix in zip(names, parents, matrices):
+        b_bone = arma.edit_bones.new(name)
+        b_bone.head = (0, 0, 0)
+        b_bone.tail = (0, 0.05, 0)
         b_bone.use_inherit_rotation = True
         b_bone.use_local_location = True
-        quad = Quaternion((float(bone["RotationQuaternion"][3]), float(bone["RotationQuaternion"][0]),
-            float(bone["RotationQuaternion"][1]), float(bone["RotationQuaternion"][2])))
-        # quad = Quaternion(map(float, bone["RotationQuaternion"]))
-        mat = quad.to_matrix().to_4x4()
-        b_bone.matrix = mat
-        position = Vector(map(float, bone["LocalOffset"]))
-        b_bone.translate(position)
-        if parent:
-            b_bone.parent = parent
-            b_bone.matrix = parent.matrix @ b_bone.matrix
-
-        # add child bones
-        for children in bone["members"]:
-            for child in children["members"]:
-                addBone(child, armature, obj, b_bone)
-
-    addBone(skel_file.data["members"][0]["members"][0], arma, Obj)
+        if parent >= 0:
+            b_bone.parent = edit_bones[parent]
+        b_bone.matrix = Matrix(matrix.tolist())
+        edit_bones.append(b_bone)
     bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
-    return Obj
+    return names
 
 
 def loadSkeleton(filepath, **kwargs):
-    global skeleton
-    skel_file = file_parser.GTA_Parser()
-    if skel_file.read_file(filepath):
-        skeleton = buildArmature(skel_file)
+    global skeleton, bone_mapping
+    skel_file = skeletons.getParsed(filepath, lambda path: readFile(path, **kwargs))
+    if skel_file:
+        bone_mapping = []
+        with profiling.stage("armature"):
+            skeleton = buildArmature(skel_file)
+        profiling.count("bones", len(bone_mapping))
+        skeletons.registerArmature(skeleton, filepath, bone_mapping)
+        sources.recordSkeleton(skeleton, filepath)
         return True
     else:
         # print(filepath)
@@ -358,11 +864,18 @@ def loadSkeleton(filepath, **kwargs):
 
 
 def loadODR(filepath, import_armature, **kwargs):
+    return runSteps(loadODRSteps(filepath, import_armature, **kwargs))
+
+
+def loadODRSteps(filepath, import_armature, **kwargs):
     global skeleton
+    kwargs["odr_path"] = filepath
     kwargs["odr_root"] = os.path.dirname(filepath)
     kwargs["odr_name"] = os.path.basename(filepath).split(".")[0]
-    odrFile = file_parser.GTA_Parser()
-    odrFile.read_file(filepath)
+    odrFile = yield from readFileSteps(filepath, **kwargs)
+    if not odrFile:
+        return None
+    yield "parse " + kwargs["odr_name"]
     name = getNameFromFile(filepath)
     lodgroup = odrFile.getMemberByName("LodGroup")
     shaders = odrFile.getMemberByName("Shaders")
@@ -370,47 +883,37 @@ def loadODR(filepath, import_armature, **kwargs):
 
     # check for odr skeleton
     if skel != "null" and import_armature != "no" and not skeleton:
-        if not isinstance(skel, str):
-            skel = " ".join(skel)
-        kwargs["odr_skeleton_path"] = os.path.join(kwargs["folder"], *skel.split("\\"))
-        if os.path.exists(kwargs["odr_skeleton_path"]):
+        kwargs["odr_skeleton_path"] = file_parser.getSkeletonPath(skel, kwargs["folder"])
+        if kwargs["resolver"].exists(kwargs["odr_skeleton_path"]):
             if import_armature == "create" or not findArmature(kwargs["odr_skeleton_path"]):
                 loadSkeleton(kwargs["odr_skeleton_path"], **kwargs)
+                yield "armature"
         else:
             print("missing odr skeleton file: {0}".format(kwargs["odr_skeleton_path"]))
 
-    mesh_path = ""
-    # get LOD
-    LODs = []
-    match = False
     if not "texture_folder" in kwargs:
         p1 = os.path.join(kwargs["odr_root"], kwargs["odr_name"])
-        if os.path.exists(p1):
+        if kwargs["resolver"].exists(p1):
             kwargs["texture_folder"] = p1
 
+    # progressive import needs the UI to be running to swap in the requested LOD
+    if (kwargs.get("progressive_lod") or kwargs.get("keep_lods")) and not bpy.app.background:
+        return importLODs(lodgroup, name, shaders, import_armature, **kwargs)
+    mesh_path = file_parser.getMeshPath(lodgroup, name, kwargs["LOD"], kwargs["folder"])
+    return (yield from importMeshSteps(mesh_path, shaders, import_armature, **kwargs))
 
-    for mesh in lodgroup["members"]:
-        for key, value in mesh.items():
-            if name in key and key.endswith(".mesh"):
-                path = os.path.join(kwargs["folder"], *key.split("\\"))
-                LODs.append(path)
-                if kwargs["LOD"] == mesh["name"]:
-                    match = True
-                    mesh_path = path
-
-    # if no match take lowest LOD
-    if not match:
-        print("LOD not found, take lowest available")
-        mesh_path = LODs[-1]
 
-    return importMesh(mesh_path, shaders, import_armature, **kwargs)
+def loadODD(filepath, import_armature, **kwargs):
+    return runSteps(loadODDSteps(filepath, import_armature, **kwargs))
 
 
-def loadODD(filepath, import_armature, **kwargs):
+def loadODDSteps(filepath, import_armature, **kwargs):
     kwargs["odd_root"] = os.path.dirname(filepath)
     kwargs["odd_name"] = os.path.basename(filepath).split(".")[0]
-    oddFile = file_parser.GTA_Parser()
-    oddFile.read_file(filepath)
+    oddFile = yield from readFileSteps(filepath, **kwargs)
+    if not oddFile:
+        return []
+    yield "parse " + kwargs["odd_name"]
     root = oddFile.getMemberByName("Version")
     mesh_list = []
     base_path = kwargs["folder"]
@@ -418,41 +921,384 @@ def loadODD(filepath, import_armature, **kwargs):
     # check for odd skeleton
     if import_armature != "no":
         kwargs["odd_skeleton_path"] = os.path.join(kwargs["odd_root"], kwargs["odd_name"], kwargs["odd_name"] + ".skel")
-        if os.path.exists(kwargs["odd_skeleton_path"]):
+        if kwargs["resolver"].exists(kwargs["odd_skeleton_path"]):
             if import_armature == "create" or not findArmature(kwargs["odd_skeleton_path"]):
                 loadSkeleton(kwargs["odd_skeleton_path"], **kwargs)
+                yield "armature"
 
+    # excluded components are never parsed, their textures never looked up
+    include = getPatterns(kwargs.get("include"))
+    exclude = getPatterns(kwargs.get("exclude"))
+    jobs = []
     for odr in root["values"]:
         odr_path = os.path.join(base_path, *odr.split("\\"))
-        kwargs["folder"] = os.path.dirname(odr_path)
-        kwargs["texture_folder"] = os.path.dirname(odr_path)
-        mesh_list.append(loadODR(odr_path, import_armature, **kwargs))
+        if useComponent(getNameFromFile(odr_path), include, exclude):
+            jobs.append((odr_path, os.path.dirname(odr_path)))
+    if len(jobs) < len(root["values"]):
+        print("importing {0} of {1} components".format(len(jobs), len(root["values"])))
+
+    # parse the components in worker processes while the previous ones are built
+    pipeline = None
+    if kwargs.get("parse_workers", 0) > 1 and len(jobs) > 1 and not kwargs.get("parsed"):
+        parse_cache = cache.getCache(kwargs.get("cache_folder", ""), kwargs.get("cache_size", 0))
+        pipeline = iter(parallel.ComponentPipeline(jobs, kwargs["parse_workers"], kwargs["LOD"], kwargs.get("parser_engine"),
+                                                   poll=parseWait, cache=parse_cache))
+    parsed = kwargs.get("parsed", {})
+
+    progress[1] += len(jobs)
+    try:
+        for odr_path, folder in jobs:
+            kwargs["folder"] = folder
+            kwargs["texture_folder"] = folder
+            if pipeline:
+                with profiling.stage("wait for workers"):
+                    results = next(pipeline)
+                while results is None:
+                    yield "wait for workers"
+                    with profiling.stage("wait for workers"):
+                        results = next(pipeline)
+                for parser in results.values():
+                    if parser:
+                        profiling.add("parse (workers)", parser.stats["seconds"])
+                kwargs["parsed"] = dict(parsed, **results)
+            mesh_list.append((yield from loadODRSteps(odr_path, import_armature, **kwargs)))
+            progress[0] += 1
+    finally:
+        # stop the workers when the import is cancelled
+        if pipeline:
+            pipeline.close()
     return mesh_list
 
 
+def rebuildArmature(Obj, skel_path, **kwargs):
+    """Replace the bones of Obj with the ones in skel_path, True if the bone order changed."""
+    skel_file = skeletons.getParsed(skel_path, lambda path: readFile(path, **kwargs))
+    if not skel_file:
+        return False
+    old_names = skeletons.getBoneMapping(Obj)
+    bpy.context.view_layer.objects.active = Obj
+    bpy.ops.object.mode_set(mode='EDIT', toggle=False)
+    for bone in list(Obj.data.edit_bones):
+        Obj.data.edit_bones.remove(bone)
+    bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
+    with profiling.stage("armature"):
+        names = buildBones(Obj, skel_file)
+    skeletons.registerArmature(Obj, skel_path, names)
+    sources.recordSkeleton(Obj, skel_path)
+    return names != old_names
+
+
+def refreshMesh(Obj, source, changed, remapped, rebuilt, counts, **kwargs):
+    global skeleton, bone_mapping
+    options = dict(source["options"])
+    import_armature = options.pop("import_armature", "auto")
+    create_materials = options.pop("create_materials", "auto")
+    kwargs.update(options)
+    odrFile = readFile(source["odr"], **kwargs) if source["odr"] else None
+    if not odrFile:
+        print("missing odr file of {0}: {1}".format(Obj.name, source["odr"]))
+        return
+    shaders = odrFile.getMemberByName("Shaders")
+    mesh_path = file_parser.getMeshPath(odrFile.getMemberByName("LodGroup"), getNameFromFile(source["odr"]),
+                                        kwargs["LOD"], kwargs["folder"])
+    mesh_path = sources.getPath(mesh_path)
+    armature = Obj.parent if Obj.parent and Obj.parent.type == 'ARMATURE' else None
+
+    if mesh_path != source["mesh"] or source["mesh"] in changed or remapped:
+        old_mesh = Obj.data
+        Obj.vertex_groups.clear()
+        if old_mesh.name in rebuilt:
+            # another refreshed object used the same mesh data
+            Obj.data = rebuilt[old_mesh.name]
+            for group_name in Obj.data.get(instances.GROUPS_PROPERTY, []):
+                Obj.vertex_groups.new(name=group_name)
+        else:
+            p = readFile(mesh_path, **kwargs)
+            if not p:
+                return
+            skinned_file = p.getMemberByName("Skinned") == "True"
+            skinned_mesh = skinned_file and import_armature != "no" and armature is not None
+            skeleton = armature
+            bone_mapping = skeletons.getBoneMapping(armature) if armature else []
+            if buildMesh(p, getNameFromFile(mesh_path), shaders, skinned_mesh, create_materials, Obj, **kwargs) is None:
+                return
+            if not kwargs.get("unique_meshes"):
+                key = instances.getKey(mesh_path, shaders, create_materials=create_materials, **kwargs)
+                instances.registerMesh(Obj.data, key, Obj.vertex_groups, skinned_file, skinned_mesh)
+            rebuilt[old_mesh.name] = Obj.data
+            counts["meshes"] += 1
+        if not old_mesh.users:
+            bpy.data.meshes.remove(old_mesh)
+    elif source["odr"] in changed and create_materials != "no":
+        slots = Obj.data.get(sources.SLOTS_PROPERTY, [])
+        for slot, shader_index in enumerate(slots):
+            if slot < len(Obj.data.materials) and shaders and shader_index < len(shaders["members"]):
+                with profiling.stage("materials"):
+                    Obj.data.materials[slot] = getMaterial(shaders, shader_index, getNameFromFile(mesh_path),
+                                                           create_materials, **kwargs)
+        counts["materials"] += len(slots)
+
+    # images changed in place keep their datablock
+    for image in bpy.data.images:
+        if image.source == 'FILE' and sources.getPath(bpy.path.abspath(image.filepath)) in changed:
+            image.reload()
+            counts["images"] += 1
+            changed.discard(sources.getPath(bpy.path.abspath(image.filepath)))
+
+    sources.recordMesh(Obj, mesh_path, source["odr"], import_armature=import_armature,
+                       create_materials=create_materials, **kwargs)
+
+
+def refresh(operator, context, objects, **kwargs):
+    """Rebuild what changed in the source files of imported objects, in place.
+
+    Selecting an armature refreshes its meshes too, selecting a mesh its
+    armature. Unchanged files are recognized by size and mtime, or by their
+    content hash when they were only touched. A changed .skel rebuilds the
+    bones, and the meshes as well if the bone order changed. A changed .mesh
+    (or an .odr pointing to another LOD file) rebuilds the mesh data, a
+    changed .odr otherwise only the materials. Changed images are reloaded.
+    """
+    global skeleton, bone_mapping, selection
+    if "resolver" not in kwargs:
+        kwargs["resolver"] = resolver.PathResolver(catalog.getCatalog(bpy.path.abspath(kwargs.get("catalog_file", ""))))
+    selection = []
+
+    armatures = []
+    meshes = []
+    for obj in objects:
+        for candidate in [obj, obj.parent] + list(obj.children):
+            if candidate is None or sources.PROPERTY not in candidate:
+                continue
+            found = armatures if candidate.type == 'ARMATURE' else meshes
+            if candidate.type in ('ARMATURE', 'MESH') and candidate not in found:
+                found.append(candidate)
+
+    counts = dict.fromkeys(("armatures", "meshes", "materials", "images"), 0)
+    remapped = set()
+    with profiling.stage("refresh"):
+        for obj in armatures:
+            source = sources.getSource(obj)
+            if sources.getChanged(source):
+                if rebuildArmature(obj, source["skeleton"], **kwargs):
+                    remapped.add(obj.name)
+                counts["armatures"] += 1
+            else:
+                sources.store(obj, source)
+
+        # objects sharing mesh data are rebuilt once, old mesh name -> new mesh
+        rebuilt = {}
+        for obj in meshes:
+            source = sources.getSource(obj)
+            changed = sources.getChanged(source)
+            bone_order_changed = obj.parent is not None and obj.parent.name in remapped
+            if changed or bone_order_changed:
+                refreshMesh(obj, source, changed, bone_order_changed, rebuilt, counts, **kwargs)
+            else:
+                sources.store(obj, source)
+    skeleton = None
+    bone_mapping = []
+
+    message = "refreshed {armatures} armatures, {meshes} meshes, {materials} materials, {images} images".format(**counts)
+    print(message)
+    operator.report({'INFO'}, message)
+    return {'FINISHED'}
+
+
+def collectFiles(filepath, import_armature="auto", **kwargs):
+    """List the files an import of filepath reads, in import order.
+
+    The .odd/.odr files have to be parsed for this, their parsers are
+    returned as well so they do not get parsed twice.
+    """
+    files = []
+    parsed = {}
+
+    def add(path, parse=False):
+        path = os.path.normpath(os.path.abspath(path))
+        if path in files or not os.path.exists(path):
+            return None
+        files.append(path)
+        if parse:
+            parsed[path] = readFile(path, **kwargs)
+            return parsed[path]
+        return None
+
+    def collectODR(odr_path, folder):
+        odrFile = add(odr_path, parse=True)
+        if not odrFile:
+            return
+        skel = odrFile.getMemberByName("Skeleton")
+        if skel and skel != "null" and import_armature != "no":
+            add(file_parser.getSkeletonPath(skel, folder))
+        lodgroup = odrFile.getMemberByName("LodGroup")
+        if lodgroup:
+            add(file_parser.getMeshPath(lodgroup, getNameFromFile(odr_path), kwargs.get("LOD", "High"), folder))
+
+    keywords = fileKeywords(filepath)
+    if keywords["file_extension"] == "odd":
+        oddFile = add(filepath, parse=True)
+        if not oddFile:
+            return files, parsed
+        if import_armature != "no":
+            add(os.path.join(keywords["folder"], keywords["name"], keywords["name"] + ".skel"))
+        include = getPatterns(kwargs.get("include"))
+        exclude = getPatterns(kwargs.get("exclude"))
+        for odr in oddFile.getMemberByName("Version")["values"]:
+            odr_path = os.path.join(keywords["folder"], *odr.split("\\"))
+            if useComponent(getNameFromFile(odr_path), include, exclude):
+                collectODR(odr_path, os.path.dirname(odr_path))
+    else:
+        collectODR(filepath, keywords["folder"])
+    return files, parsed
+
+
+# datablock collections an import adds to, removed in this order on rollback
+DATABLOCKS = ("objects", "meshes", "armatures", "materials", "node_groups", "images")
+
+
+def getDatablocks():
+    return {name: {block.as_pointer() for block in getattr(bpy.data, name)} for name in DATABLOCKS}
+
+
+def removeDatablocks(before):
+    """Remove every datablock created since getDatablocks() returned before."""
+    removed = 0
+    for name in DATABLOCKS:
+        collection = getattr(bpy.data, name)
+        for block in [block for block in collection if block.as_pointer() not in before[name]]:
+            collection.remove(block)
+            removed += 1
+    return removed
+
+
 def deselectAll():
     for obj in bpy.data.objects:
         obj.select_set(False)
 
 
 def load(operator, context, filepath="", import_armature=False, **kwargs):
-    global bone_mapping, skeleton, selection
-    skeleton = None
-    bone_mapping = []
+    """Import an .odr or .odd file.
+
+    For .odd files, include and exclude select components by name with
+    fnmatch patterns, as a list or a comma separated string.
+    """
+    return runSteps(loadSteps(operator, context, filepath, import_armature, **kwargs))
+
+
+def loadFiles(operator, context, filepaths, import_armature=False, **kwargs):
+    """Import several .odr/.odd files in one run, see loadFilesSteps."""
+    return runSteps(loadFilesSteps(operator, context, filepaths, import_armature, **kwargs))
+
+
+def loadSteps(operator, context, filepath="", import_armature=False, **kwargs):
+    """Generator version of load, every step yields a short description.
+
+    Steps are one parse, armature, geometry assembly, mesh creation, vertex
+    attribute upload or material each. progress counts the finished and the
+    total components.
+    """
+    return (yield from loadFilesSteps(operator, context, [filepath], import_armature, **kwargs))
+
+
+def parseAhead(filepaths, dependencies=None, **kwargs):
+    """Parse everything the files reference in parse_workers processes, path -> parser.
+
+    Cached files are loaded from the cache, new parses are stored in it.
+    dependencies, if given, gets the list of files every input references.
+    """
+    parsed = {}
+    pending = []
+    for filepath in filepaths:
+        files, discovered = collectFiles(filepath, **kwargs)
+        if dependencies is not None:
+            dependencies[filepath] = files
+        parsed.update(discovered)
+        pending.extend(path for path in files if path not in parsed and path not in pending)
+    parse_cache = cache.getCache(kwargs.get("cache_folder", ""), kwargs.get("cache_size", 0))
+    if parse_cache:
+        for path in list(pending):
+            parser = parse_cache.load(path)
+            if parser:
+                parsed[path] = parser
+                pending.remove(path)
+    parsed.update(parallel.parseFiles(pending, kwargs["parse_workers"], kwargs.get("parser_engine")))
+    if parse_cache:
+        for path in pending:
+            if parsed[path]:
+                parse_cache.store(parsed[path])
+    return parsed
+
+
+def loadFilesSteps(operator, context, filepaths, import_armature=False, **kwargs):
+    """Import the files one after another, sharing everything that can be shared.
+
+    The resolver, files parsed ahead, the selection armatures are picked
+    from and the profile are set up once. Armatures, materials, images and
+    mesh data are shared through their registries as in separate imports.
+    Only the armature of the previous file is forgotten for every file.
+    """
+    global bone_mapping, skeleton, selection, weld_report, progress
+    weld_report = [0, 0]
+    progress = [0, 0]
+    profile = profiling.start(kwargs.get("profile_memory", False)) if kwargs.get("profile_import") else None
 
     def message(self, context):
         self.layout.label(text="failed to import model!")
 
+    if "resolver" not in kwargs:
+        kwargs["resolver"] = resolver.PathResolver(catalog.getCatalog(bpy.path.abspath(kwargs.get("catalog_file", ""))))
+
     selection = bpy.context.selected_objects
     deselectAll()
     bpy.context.view_layer.objects.active = None
 
-    if kwargs["file_extension"] == "odr":
-        meshObjects = [loadODR(filepath, import_armature, **kwargs)]
-    if kwargs["file_extension"] == "odd":
-        meshObjects = loadODD(filepath, import_armature, **kwargs)
-
-
-    if not meshObjects:
+    meshObjects = []
+    try:
+        if "parsed" in kwargs:
+            kwargs["parsed"] = {os.path.normpath(os.path.abspath(path)): parser for path, parser in kwargs["parsed"].items()}
+        elif kwargs.get("parse_workers", 0) > 1 and len(filepaths) > 1:
+            kwargs["parsed"] = yield from threadSteps("parse {0} files".format(len(filepaths)), parseAhead, filepaths,
+                                                      import_armature=import_armature, **kwargs)
+            yield "parse {0} files".format(len(kwargs["parsed"]))
+
+        for filepath in filepaths:
+            skeleton = None
+            bone_mapping = []
+            kwargs.update(fileKeywords(filepath))
+            if kwargs["file_extension"] == "odr":
+                progress[1] += 1
+                meshObjects.append((yield from loadODRSteps(filepath, import_armature, **kwargs)))
+                progress[0] += 1
+            if kwargs["file_extension"] == "odd":
+                meshObjects.extend((yield from loadODDSteps(filepath, import_armature, **kwargs)))
+    finally:
+        if profile:
+            profiling.stop()
+
+    if profile:
+        # files parsed before the import started report their own parse times
+        for parser in kwargs.get("parsed", {}).values():
+            if parser:
+                profile.add("parse (ahead)", parser.stats["seconds"])
+        print(profile.table())
+        operator.report({'INFO'}, profile.summary())
+        if kwargs.get("profile_file"):
+            profile.write(bpy.path.abspath(kwargs["profile_file"]),
+                          filepath=filepaths[0] if len(filepaths) == 1 else filepaths)
+
+
+    if kwargs.get("weld_vertices") and weld_report[0]:
+        operator.report({'INFO'}, "welded {0} -> {1} vertices".format(*weld_report))
+
+    parse_cache = cache.getCache(kwargs.get("cache_folder", ""), kwargs.get("cache_size", 0))
+    if parse_cache:
+        print(parse_cache.report())
+        operator.report({'INFO'}, parse_cache.report())
+
+    if len(filepaths) > 1:
+        operator.report({'INFO'}, "imported {0} objects from {1} files".format(
+            len([obj for obj in meshObjects if obj]), len(filepaths)))
+    if not any(meshObjects) and not bpy.app.background:
         bpy.context.window_manager.popup_menu(message, title="Error", icon='ERROR')
     return {'FINISHED'}
\ No newline at end of file
@@ -0,0 +1,174 @@
+"""Describe models without decoding their geometry.
+
+    python inspector.py model.odd
+
+Mesh files are read in lazy mode, only their structure is scanned.
+"""
+
+try:
+    from . import file_parser
+except ImportError:
+    import file_parser
+
+import json
+import mmap
+import os
+import sys
+
+# path -> (size, mtime, vertex count) of the meshes scanComponents counted
+_vertex_counts = {}
+
+
+def getSamplers(shader):
+    samplers = {}
+    for key, value in shader.items():
+        if key.endswith("Sampler"):
+            samplers[key] = value if isinstance(value, str) else " ".join(value)
+    return samplers
+
+
+def inspectMesh(filepath):
+    info = {"path": filepath, "exists": os.path.exists(filepath), "geometries": [], "vertices": 0, "triangles": 0}
+    mesh = file_parser.parseFile(filepath, lazy=True) if info["exists"] else None
+    if not mesh:
+        return info
+    info["skinned"] = mesh.getMemberByName("Skinned") == "True"
+    info["bone_count"] = int(mesh.getMemberByName("BoneCount") or 0)
+    geometries = mesh.getMemberByName("Geometries")
+    for geometry in geometries["members"] if geometries else []:
+        vertices = file_parser.getChild(geometry, "Vertices")
+        indices = file_parser.getChild(geometry, "Indices")
+        vertex_count = file_parser.getBlockCount(vertices) if vertices else 0
+        index_count = file_parser.getBlockCount(indices) if indices else 0
+        info["geometries"].append({
+            "shader_index": int(geometry.get("ShaderIndex", 0)),
+            "vertex_declaration": geometry.get("VertexDeclaration"),
+            "vertices": vertex_count,
+            "triangles": index_count // 3 if index_count is not None else None,
+        })
+        info["vertices"] += vertex_count or 0
+        info["triangles"] += index_count // 3 if index_count else 0
+    return info
+
+
+def inspectODR(filepath, folder=None):
+    folder = folder or os.path.dirname(filepath)
+    name = os.path.basename(filepath).split(".")[0]
+    info = {"name": name, "path": filepath, "exists": os.path.exists(filepath),
+            "skeleton": None, "shaders": [], "textures": [], "lods": {}}
+    odr = file_parser.parseFile(filepath, lazy=True) if info["exists"] else None
+    if not odr:
+        return info
+
+    skel = odr.getMemberByName("Skeleton")
+    if skel and skel != "null":
+        info["skeleton"] = file_parser.getSkeletonPath(skel, folder)
+
+    textures = []
+    shaders = odr.getMemberByName("Shaders")
+    for shader in shaders["members"] if shaders else []:
+        samplers = getSamplers(shader)
+        info["shaders"].append({"name": shader["name"], "samplers": samplers})
+        textures.extend(sampler for sampler in samplers.values() if sampler not in textures)
+    info["textures"] = textures
+
+    lodgroup = odr.getMemberByName("LodGroup")
+    for lod, mesh_path in file_parser.getMeshPaths(lodgroup, name, folder) if lodgroup else []:
+        info["lods"][lod] = inspectMesh(mesh_path)
+    return info
+
+
+def inspectModel(filepath):
+    """Report the LODs, geometries, vertex/triangle counts and textures of a model.
+
+    Works on .odr and .odd files, an .odd lists one entry per component.
+    """
+    name = os.path.basename(filepath).split(".")[0]
+    folder = os.path.dirname(filepath)
+    info = {"name": name, "path": filepath, "type": filepath.rsplit(".", 1)[-1].lower(),
+            "skeleton": None, "components": []}
+    if info["type"] == "odd":
+        odd = file_parser.parseFile(filepath, lazy=True)
+        if not odd:
+            return info
+        skel_path = os.path.join(folder, name, name + ".skel")
+        if os.path.exists(skel_path):
+            info["skeleton"] = skel_path
+        root = odd.getMemberByName("Version")
+        for odr in root["values"] if root else []:
+            odr_path = os.path.join(folder, *odr.split("\\"))
+            info["components"].append(inspectODR(odr_path, os.path.dirname(odr_path)))
+    else:
+        info["components"].append(inspectODR(filepath, folder))
+    return info
+
+
+def countVertices(filepath):
+    """Vertex count of a mesh file from the counts on its Vertices lines, None if it is missing.
+
+    The payloads sit between the block headers, so the whole file is still
+    searched, but only for the block name: nothing is decoded or split. A
+    Vertices block without a count falls back to a lazy parse. Counts are
+    kept until the file changes.
+    """
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    cached = _vertex_counts.get(filepath)
+    if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+    vertices = 0
+    if stat.st_size:
+        with open(filepath, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            pos = buffer.find(b"Vertices")
+            while pos != -1:
+                line_start = buffer.rfind(b"\n", 0, pos) + 1
+                line_end = buffer.find(b"\n", pos)
+                tokens = buffer[line_start:line_end if line_end != -1 else len(buffer)].split()
+                if tokens[0] == b"Vertices":
+                    if len(tokens) < 2 or not tokens[1].isdigit():
+                        vertices = None
+                        break
+                    vertices += int(tokens[1])
+                pos = buffer.find(b"Vertices", pos + 1)
+    if vertices is None:
+        vertices = inspectMesh(filepath)["vertices"]
+    _vertex_counts[filepath] = (stat.st_size, stat.st_mtime_ns, vertices)
+    return vertices
+
+
+def scanComponents(filepath, catalog=None):
+    """Name, path and vertex count per LOD of every component of an .odd.
+
+    Answered from the catalog when it indexed the .odd, otherwise from the
+    .odr files and the Vertices headers of their meshes (see countVertices).
+    Missing meshes have None as vertex count.
+    """
+    model = catalog.getModel(filepath) if catalog is not None else None
+    components = []
+    if model is not None:
+        for odr_path in model["components"]:
+            odr = catalog.getModel(odr_path) or {"lods": []}
+            lods = {}
+            for lod, mesh_path in odr["lods"]:
+                mesh = catalog.getMesh(mesh_path)
+                lods[lod] = mesh["vertices"] if mesh else None
+            components.append({"name": os.path.basename(odr_path).split(".")[0], "path": odr_path, "lods": lods})
+        return components
+    odd = file_parser.parseFile(filepath, lazy=True)
+    root = odd.getMemberByName("Version") if odd else None
+    for odr in root["values"] if root else []:
+        odr_path = os.path.join(os.path.dirname(filepath), *odr.split("\\"))
+        name = os.path.basename(odr_path).split(".")[0]
+        odr_file = file_parser.parseFile(odr_path, lazy=True) if os.path.exists(odr_path) else None
+        lodgroup = odr_file.getMemberByName("LodGroup") if odr_file else None
+        mesh_paths = file_parser.getMeshPaths(lodgroup, name, os.path.dirname(odr_path)) if lodgroup else []
+        components.append({"name": name, "path": odr_path,
+                           "lods": {lod: countVertices(mesh_path) for lod, mesh_path in mesh_paths}})
+    return components
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        print(json.dumps(inspectModel(path), indent=2))
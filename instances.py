@@ -0,0 +1,67 @@
+from . import registry
+
+import bpy
+import hashlib
+import json
+import os
+
+# custom properties of imported meshes
+PROPERTY = "gta_instance"
+GROUPS_PROPERTY = "gta_vertex_groups"
+SKINNED_PROPERTY = "gta_skinned"
+WEIGHTED_PROPERTY = "gta_weighted"
+
+# instance key -> mesh name
+_meshes = registry.Registry("meshes", PROPERTY)
+
+# import options that change the mesh data, materials are part of it
+MESH_OPTIONS = ("LOD", "create_materials", "texture_format", "texture_folder", "max_influences", "normalize_weights",
+                "weld_vertices")
+
+
+def getShadersHash(shaders):
+    """Hash of the Shaders block of the .odr the materials of a mesh come from."""
+    source = json.dumps(shaders, default=lambda member: member.items())
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+
+def getKey(filepath, shaders=None, **kwargs):
+    """Key of the mesh data an import of filepath with these shaders and options produces."""
+    path = os.path.normcase(os.path.normpath(os.path.abspath(filepath)))
+    stat = os.stat(filepath)
+    options = ",".join("{0}={1}".format(option, kwargs.get(option)) for option in MESH_OPTIONS)
+    return "{0}|{1}|{2}|{3}|{4}".format(path, stat.st_size, stat.st_mtime_ns, options, getShadersHash(shaders))
+
+
+def registerMesh(mesh, key, vertex_groups, skinned, weighted):
+    mesh[GROUPS_PROPERTY] = [group.name for group in vertex_groups]
+    mesh[SKINNED_PROPERTY] = skinned
+    mesh[WEIGHTED_PROPERTY] = weighted
+    _meshes.register(mesh, key)
+
+
+def findMesh(key):
+    return _meshes.find(key)
+
+
+def newInstance(name, mesh):
+    """New object using existing mesh data, with the vertex groups the data was weighted for."""
+    obj = bpy.data.objects.new(name, mesh)
+    addVertexGroups(obj, mesh)
+    return obj
+
+
+def addVertexGroups(obj, mesh):
+    """Add the vertex groups mesh was weighted for that obj does not have yet."""
+    for group_name in mesh.get(GROUPS_PROPERTY, []):
+        if group_name not in obj.vertex_groups:
+            obj.vertex_groups.new(name=group_name)
+
+
+def clear():
+    _meshes.clear()
+
+
+@bpy.app.handlers.persistent
+def onLoadPost(*args):
+    clear()
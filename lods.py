@@ -0,0 +1,126 @@
+import bpy
+import threading
+
+# custom property of objects, LOD name -> mesh name of every kept LOD
+PROPERTY = "gta_lods"
+# custom property of objects, the LOD their mesh data currently shows
+ACTIVE_PROPERTY = "gta_lod"
+# seconds between checks for finished background parses
+INTERVAL = 0.1
+
+# running streams, kept so they can be cancelled
+_streams = []
+
+
+class LODStream:
+    """Parses mesh files in a background thread and builds them on the main thread.
+
+    jobs is a list of (LOD, path) tuples, parsed in order by parse(path) in
+    the thread. A bpy.app.timers callback hands every finished parse to
+    build(obj, LOD, path, parser), one per call so the UI stays responsive.
+    The stream stops when the object is removed.
+    """
+
+    def __init__(self, obj, jobs, parse, build):
+        self.object_name = obj.name
+        self.pointer = obj.as_pointer()
+        self.jobs = jobs
+        self.parse = parse
+        self.build = build
+        self.results = []
+        self.built = 0
+        self.cancelled = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        _streams.append(self)
+        self.thread.start()
+        bpy.app.timers.register(self.update, first_interval=INTERVAL)
+
+    def run(self):
+        for lod, path in self.jobs:
+            if self.cancelled:
+                return
+            try:
+                parser = self.parse(path)
+            except Exception as error:
+                print("failed to parse {0}: {1}".format(path, error))
+                parser = None
+            self.results.append((lod, path, parser))
+
+    def getObject(self):
+        obj = bpy.data.objects.get(self.object_name)
+        if obj is None or obj.as_pointer() != self.pointer:
+            # renamed since the stream started
+            obj = next((obj for obj in bpy.data.objects if obj.as_pointer() == self.pointer), None)
+            if obj is not None:
+                self.object_name = obj.name
+        return obj
+
+    def cancel(self):
+        self.cancelled = True
+        if self in _streams:
+            _streams.remove(self)
+
+    def update(self):
+        if self.cancelled:
+            return None
+        obj = self.getObject()
+        if obj is None:
+            print("object removed, stopped loading LODs of {0}".format(self.object_name))
+            self.cancel()
+            return None
+        # mesh data can't be replaced while it is edited
+        if obj.mode == 'EDIT':
+            return INTERVAL
+        if self.built < len(self.results):
+            lod, path, parser = self.results[self.built]
+            self.built += 1
+            if parser:
+                try:
+                    self.build(obj, lod, path, parser)
+                except Exception as error:
+                    print("failed to load {0} LOD of {1}: {2}".format(lod, self.object_name, error))
+        if self.built == len(self.jobs):
+            self.cancel()
+            return None
+        return 0.0 if self.built < len(self.results) else INTERVAL
+
+
+def stream(obj, jobs, parse, build):
+    loader = LODStream(obj, jobs, parse, build)
+    loader.start()
+    return loader
+
+
+def keepLOD(obj, lod, mesh):
+    """Remember mesh as LOD of obj, the mesh survives saving while it is not shown."""
+    mesh.use_fake_user = True
+    names = dict(obj.get(PROPERTY, {}))
+    names[lod] = mesh.name
+    obj[PROPERTY] = names
+
+
+def getLODs(obj):
+    names = obj.get(PROPERTY, {})
+    return {lod: bpy.data.meshes.get(names[lod]) for lod in names.keys() if bpy.data.meshes.get(names[lod])}
+
+
+def showLOD(obj, lod, mesh=None):
+    """Use the mesh data of lod on obj, materials, modifiers and parenting stay as they are."""
+    mesh = mesh or getLODs(obj).get(lod)
+    if mesh is None:
+        return False
+    obj.data = mesh
+    obj[ACTIVE_PROPERTY] = lod
+    return True
+
+
+def clear():
+    for loader in list(_streams):
+        loader.cancel()
+
+
+@bpy.app.handlers.persistent
+def onLoadPost(*args):
+    clear()
@@ -0,0 +1,85 @@
+from . import profiling
+from . import registry
+
+import bpy
+import hashlib
+import json
+import os
+
+# custom property of materials, signature of the shader they were built from
+PROPERTY = "gta_material"
+INVERT_GREEN_GROUP = "GTA invert green"
+
+# signature -> material name
+_materials = registry.Registry("materials", PROPERTY)
+# normalized image path -> image name
+_images = {}
+
+
+def getSignature(samplers, parameters):
+    """Hash of everything a material is built from.
+
+    samplers maps a sampler to its resolved image path, or to the texture name
+    from the shader when the image was not found, so materials with different
+    missing textures stay apart. parameters holds the shader values that are used.
+    """
+    source = json.dumps([sorted(samplers.items()), sorted(parameters.items())])
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+
+def registerMaterial(mat, signature):
+    _materials.register(mat, signature)
+
+
+def findMaterial(signature):
+    return _materials.find(signature)
+
+
+def loadImage(image_path):
+    """Load an image once per file, later calls return the same datablock."""
+    key = os.path.normcase(os.path.normpath(os.path.abspath(image_path)))
+    img = bpy.data.images.get(_images.get(key, ""))
+    if img is None:
+        with profiling.stage("image load"):
+            img = bpy.data.images.load(image_path, check_existing=True)
+        profiling.count("images loaded")
+        _images[key] = img.name
+    return img
+
+
+def getInvertGreenGroup():
+    """Node group that inverts the green channel of a normal map, shared by all materials."""
+    group = bpy.data.node_groups.get(INVERT_GREEN_GROUP)
+    if group is not None:
+        return group
+    group = bpy.data.node_groups.new(INVERT_GREEN_GROUP, 'ShaderNodeTree')
+    if hasattr(group, "interface"):
+        group.interface.new_socket("Color", in_out='INPUT', socket_type='NodeSocketColor')
+        group.interface.new_socket("Color", in_out='OUTPUT', socket_type='NodeSocketColor')
+    else:
+        group.inputs.new('NodeSocketColor', "Color")
+        group.outputs.new('NodeSocketColor', "Color")
+    nodes = group.nodes
+    links = group.links
+    group_in = nodes.new("NodeGroupInput")
+    group_out = nodes.new("NodeGroupOutput")
+    seperateRGB = nodes.new("ShaderNodeSeparateRGB")
+    invertNode = nodes.new("ShaderNodeInvert")
+    combineRGB = nodes.new("ShaderNodeCombineRGB")
+    links.new(group_in.outputs[0], seperateRGB.inputs[0])
+    links.new(seperateRGB.outputs[1], invertNode.inputs[1])
+    links.new(invertNode.outputs[0], combineRGB.inputs[1])
+    links.new(seperateRGB.outputs[0], combineRGB.inputs[0])
+    links.new(seperateRGB.outputs[2], combineRGB.inputs[2])
+    links.new(combineRGB.outputs[0], group_out.inputs[0])
+    return group
+
+
+def clear():
+    _materials.clear()
+    _images.clear()
+
+
+@bpy.app.handlers.persistent
+def onLoadPost(*args):
+    clear()
@@ -0,0 +1,193 @@
+try:
+    from . import file_parser
+except ImportError:
+    import file_parser
+
+import collections
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from multiprocessing import shared_memory
+import numpy as np
+
+
+# run in every worker before anything is unpickled: the addon package
+# imports bpy when it is loaded, so an empty package of the same name takes
+# its place and only the modules the workers need get imported from it
+PACKAGE_STUB = """
+import sys, types
+if {name!r} not in sys.modules:
+    package = types.ModuleType({name!r})
+    package.__path__ = [{folder!r}]
+    sys.modules[{name!r}] = package
+"""
+
+
+def newProcessPool(workers):
+    context = multiprocessing.get_context("spawn")
+    if not __package__:
+        # loaded as a top level module, workers find it on the inherited sys.path
+        return ProcessPoolExecutor(max_workers=workers or None, mp_context=context)
+    stub = PACKAGE_STUB.format(name=__package__, folder=os.path.dirname(os.path.abspath(__file__)))
+    return ProcessPoolExecutor(max_workers=workers or None, mp_context=context, initializer=exec, initargs=(stub,))
+
+
+def parseFiles(paths, workers=0, engine=None):
+    """Parse paths in a process pool and return {path: parser}.
+
+    The parser is None for missing files. workers=0 starts one process per
+    cpu, workers=1 parses in this process.
+    """
+    paths = list(dict.fromkeys(paths))
+    if workers == 1 or len(paths) < 2:
+        return {path: file_parser.parseFile(path, engine) for path in paths}
+    with newProcessPool(workers) as executor:
+        return dict(zip(paths, executor.map(file_parser.parseFile, paths, [engine] * len(paths))))
+
+
+def shareArrays(node, blocks):
+    # move every array of the member tree into its own shared memory block
+    if isinstance(node, np.ndarray):
+        block = shared_memory.SharedMemory(create=True, size=max(node.nbytes, 1))
+        np.ndarray(node.shape, node.dtype, buffer=block.buf)[...] = node
+        blocks.append(block)
+        return {"__shm__": block.name, "shape": node.shape, "dtype": node.dtype.str}
+    if hasattr(node, "items"):
+        return {key: shareArrays(value, blocks) for key, value in node.items()
+                if not (key == "positions" and "columns" in node)}
+    if isinstance(node, list):
+        return [shareArrays(value, blocks) for value in node]
+    return node
+
+
+def collectArrays(node):
+    if isinstance(node, dict):
+        if "__shm__" in node:
+            block = shared_memory.SharedMemory(name=node["__shm__"])
+            array = np.array(np.ndarray(node["shape"], np.dtype(node["dtype"]), buffer=block.buf))
+            block.close()
+            block.unlink()
+            return array
+        return file_parser.toMember((key, collectArrays(value)) for key, value in node.items())
+    if isinstance(node, list):
+        return [collectArrays(value) for value in node]
+    return node
+
+
+def releaseArrays(future):
+    # free the shared memory blocks of a result that is never consumed
+    if future.exception() is None:
+        for parser in future.result().values():
+            if parser:
+                collectArrays(parser.data)
+
+
+def parseComponent(odr_path, folder, LOD, engine=None, share=True):
+    """Parse a .odr file and the mesh of the chosen LOD.
+
+    Returns {path: parser}. With share the arrays of the member trees are
+    handed over in shared memory blocks instead of being pickled.
+    """
+    parsed = {}
+    odr = file_parser.parseFile(odr_path, engine)
+    parsed[os.path.normpath(os.path.abspath(odr_path))] = odr
+    if odr:
+        lodgroup = odr.getMemberByName("LodGroup")
+        if lodgroup:
+            mesh_path = file_parser.getMeshPath(lodgroup, os.path.basename(odr_path).split(".")[0], LOD, folder)
+            parsed[os.path.normpath(os.path.abspath(mesh_path))] = file_parser.parseFile(mesh_path, engine)
+    if share:
+        blocks = []
+        for parser in parsed.values():
+            if parser:
+                parser.data = shareArrays(parser.data, blocks)
+        # the receiving process unlinks the blocks
+        for block in blocks:
+            block.close()
+    return parsed
+
+
+class ComponentPipeline:
+    """Parse components ahead of time while the caller builds them.
+
+    jobs is a list of (odr_path, folder) tuples. Iterating yields the parse
+    results of parseComponent in job order, as soon as each one is ready.
+    At most prefetch components are parsed ahead of the consumer. With poll,
+    iterating yields None every poll seconds until the next result is ready.
+    Components found in cache (a ParseCache) are not sent to the workers,
+    the files the workers parse are stored in it.
+    """
+
+    def __init__(self, jobs, workers, LOD, engine=None, prefetch=0, poll=0, cache=None):
+        self.jobs = list(jobs)
+        self.LOD = LOD
+        self.engine = engine
+        self.prefetch = prefetch or workers * 2
+        self.poll = poll
+        self.cache = cache
+        # shared memory blocks die with their last handle on windows, use
+        # threads there
+        self.share = os.name != "nt"
+        if self.share:
+            self.executor = newProcessPool(workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def loadCached(self, odr_path, folder):
+        # the .odr and the mesh of the chosen LOD, None unless both are cached
+        odr = self.cache.load(odr_path) if os.path.exists(odr_path) else None
+        if not odr:
+            return None
+        parsed = {os.path.normpath(os.path.abspath(odr_path)): odr}
+        lodgroup = odr.getMemberByName("LodGroup")
+        if lodgroup:
+            mesh_path = file_parser.getMeshPath(lodgroup, os.path.basename(odr_path).split(".")[0], self.LOD, folder)
+            mesh = self.cache.load(mesh_path) if os.path.exists(mesh_path) else None
+            if not mesh:
+                return None
+            parsed[os.path.normpath(os.path.abspath(mesh_path))] = mesh
+        return parsed
+
+    def submit(self, job):
+        odr_path, folder = job
+        parsed = self.loadCached(odr_path, folder) if self.cache else None
+        if parsed is not None:
+            future = Future()
+            future.set_result(parsed)
+            future.cached = True
+            return future
+        return self.executor.submit(parseComponent, odr_path, folder, self.LOD, self.engine, self.share)
+
+    def __iter__(self):
+        pending = collections.deque()
+        jobs = iter(self.jobs)
+        try:
+            for job in itertools.islice(jobs, self.prefetch):
+                pending.append(self.submit(job))
+            while pending:
+                if self.poll:
+                    while not wait([pending[0]], timeout=self.poll).done:
+                        yield None
+                future = pending.popleft()
+                parsed = future.result()
+                for job in itertools.islice(jobs, 1):
+                    pending.append(self.submit(job))
+                if not getattr(future, "cached", False):
+                    for parser in parsed.values():
+                        if parser and self.share:
+                            parser.data = collectArrays(parser.data)
+                        if parser and self.cache:
+                            self.cache.store(parser)
+                yield parsed
+        finally:
+            # every queued parse is in pending, cancelling them is what
+            # shutdown(cancel_futures=True) does on python 3.9+
+            for future in pending:
+                future.cancel()
+            # parses that already run are not waited for, the import is cancelled or done
+            self.executor.shutdown(wait=False)
+            if self.share:
+                for future in pending:
+                    if not getattr(future, "cached", False) and not future.cancelled():
+                        future.add_done_callback(releaseArrays)
@@ -0,0 +1,127 @@
+"""Stage timers and counters for one import.
+
+Nothing is recorded unless start() was called, stage() and count() are
+cheap no-ops otherwise. Stages can be nested, every stage reports the time
+spent inside it including its nested stages. The peak memory comes from
+tracemalloc, it covers Python and numpy allocations but not Blender's own.
+Tracing every allocation slows the import down noticeably, so it is only
+on with track_memory and its timings should not be compared to a run
+without it.
+"""
+
+import json
+import os
+import platform
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# the profile of the running import, None when profiling is off
+active = None
+
+
+class Profile:
+    def __init__(self, track_memory=False):
+        self.stages = {}
+        self.counters = {}
+        self.order = []
+        self.track_memory = track_memory and not tracemalloc.is_tracing()
+        self.peak_memory = None
+        self.seconds = 0.0
+        self.start = time.perf_counter()
+        if self.track_memory:
+            tracemalloc.start()
+
+    def add(self, name, seconds, calls=1):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = [0.0, 0]
+            self.order.append(name)
+        stage[0] += seconds
+        stage[1] += calls
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def stop(self):
+        self.seconds = time.perf_counter() - self.start
+        if self.track_memory:
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.track_memory = False
+        return self
+
+    def summary(self, stages=6):
+        """One line report: total time, the slowest stages and the peak memory."""
+        slowest = sorted(self.order, key=lambda name: -self.stages[name][0])[:stages]
+        parts = ["{0} {1:.2f}s".format(name, self.stages[name][0]) for name in slowest]
+        text = "import {0:.2f}s: {1}".format(self.seconds, ", ".join(parts))
+        if self.peak_memory is not None:
+            text += ", peak memory {0:.1f} MB".format(self.peak_memory / 1e6)
+        return text
+
+    def table(self):
+        lines = ["{0:<24} {1:>9} {2:>7}".format("stage", "seconds", "calls")]
+        for name in self.order:
+            seconds, calls = self.stages[name]
+            lines.append("{0:<24} {1:>9.3f} {2:>7}".format(name, seconds, calls))
+        for name, value in sorted(self.counters.items()):
+            lines.append("{0:<24} {1:>9}".format(name, value))
+        if self.peak_memory is not None:
+            lines.append("{0:<24} {1:>9.1f}".format("peak memory (MB)", self.peak_memory / 1e6))
+        return "\n".join(lines)
+
+    def toDict(self):
+        return {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "platform": platform.platform(),
+            "seconds": self.seconds,
+            "peak_memory": self.peak_memory,
+            "stages": {name: {"seconds": self.stages[name][0], "calls": self.stages[name][1]} for name in self.order},
+            "counters": dict(self.counters),
+        }
+
+    def write(self, path, **info):
+        data = self.toDict()
+        data.update(info)
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
+
+
+def start(track_memory=False):
+    global active
+    active = Profile(track_memory)
+    return active
+
+
+def stop():
+    global active
+    profile = active
+    active = None
+    return profile.stop() if profile else None
+
+
+@contextmanager
+def stage(name):
+    if active is None:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        # the import may have stopped the profile inside the stage
+        if active is not None:
+            active.add(name, time.perf_counter() - start_time)
+
+
+def add(name, seconds, calls=1):
+    if active is not None:
+        active.add(name, seconds, calls)
+
+
+def count(name, value=1):
+    if active is not None:
+        active.count(name, value)
@@ -0,0 +1,59 @@
+import bpy
+
+
+class Registry:
+    """Datablocks of one bpy.data collection, found by the key stored in a custom property.
+
+    Names are remembered when a datablock is registered. A lookup that
+    misses scans the collection again when it could have changed: nothing
+    was scanned yet, the collection grew or shrank (appended or linked
+    datablocks), or the remembered name no longer resolves (renamed or
+    removed). accept(datablock) limits which datablocks can be returned.
+    """
+
+    def __init__(self, collection, key_property, accept=None):
+        self.collection = collection
+        self.property = key_property
+        self.accept = accept
+        self.names = {}
+        # length of the collection when it was last scanned, None before the first scan
+        self.size = None
+
+    def getCollection(self):
+        return getattr(bpy.data, self.collection)
+
+    def isRegistered(self, datablock, key):
+        return (datablock is not None and datablock.get(self.property) == key
+                and (self.accept is None or self.accept(datablock)))
+
+    def register(self, datablock, key):
+        datablock[self.property] = key
+        self.names[key] = datablock.name
+        if self.size is not None:
+            # the new datablock is known, it does not make the index stale
+            self.size = len(self.getCollection())
+
+    def scan(self):
+        collection = self.getCollection()
+        self.names = {}
+        for datablock in collection:
+            if self.property in datablock and (self.accept is None or self.accept(datablock)):
+                self.names.setdefault(datablock[self.property], datablock.name)
+        self.size = len(collection)
+
+    def isStale(self, key):
+        return self.size is None or key in self.names or len(self.getCollection()) != self.size
+
+    def find(self, key):
+        datablock = self.getCollection().get(self.names.get(key, ""))
+        if not self.isRegistered(datablock, key) and self.isStale(key):
+            self.scan()
+            datablock = self.getCollection().get(self.names.get(key, ""))
+        if self.isRegistered(datablock, key):
+            return datablock
+        self.names.pop(key, None)
+        return None
+
+    def clear(self):
+        self.names.clear()
+        self.size = None
@@ -0,0 +1,124 @@
+try:
+    from . import profiling
+except ImportError:
+    import profiling
+
+import os
+
+
+class PathResolver:
+    """Answers file lookups of one import from cached directory listings.
+
+    Every directory is listed once into a case-insensitive name -> path map.
+    Recursive searches walk a folder once and are answered from that index
+    afterwards. Results, including misses, are remembered. Folders below the
+    roots of a catalog (see catalog.py) are answered from its index, a lookup
+    it can't answer checks the disk once per folder for files added after
+    indexing.
+    """
+
+    def __init__(self, catalog=None):
+        self.catalog = catalog
+        self.listings = {}
+        self.walks = {}
+        self.results = {}
+        self.listed = 0
+        # folders whose catalog listing or walk was checked against the disk
+        self.refreshed = set()
+
+    def isCatalogued(self, folder):
+        return self.catalog is not None and self.catalog.covers(folder)
+
+    def listDisk(self, folder):
+        try:
+            paths = [os.path.join(folder, name) for name in os.listdir(folder)]
+        except OSError:
+            paths = []
+        self.listed += 1
+        profiling.count("directory listings")
+        return paths
+
+    def listDirectory(self, folder):
+        folder = os.path.normpath(os.path.abspath(folder))
+        key = os.path.normcase(folder)
+        listing = self.listings.get(key)
+        if listing is None:
+            if self.isCatalogued(folder):
+                paths = self.catalog.listDirectory(folder)
+                profiling.count("catalog listings")
+            else:
+                paths = self.listDisk(folder)
+            listing = {os.path.basename(path).lower(): path for path in paths}
+            self.listings[key] = listing
+        return listing
+
+    def exists(self, path):
+        """Return the real path of an existing file or folder, otherwise None."""
+        profiling.count("path lookups")
+        folder, name = os.path.split(os.path.normpath(os.path.abspath(path)))
+        listing = self.listDirectory(folder)
+        result = listing.get(name.lower())
+        key = ("list", os.path.normcase(folder))
+        if result is None and key not in self.refreshed and self.isCatalogued(folder):
+            # the file may have been added after the catalog was indexed
+            self.refreshed.add(key)
+            listing.update((os.path.basename(path).lower(), path) for path in self.listDisk(folder))
+            result = listing.get(name.lower())
+        return result
+
+    def walkFolder(self, folder, disk=False):
+        # same order as os.walk(topdown=False), every visited folder is listed
+        # on the way so later exists() calls below it are free. disk walks the
+        # folder itself even when the catalog covers it
+        key = os.path.normcase(os.path.normpath(os.path.abspath(folder)))
+        walk = self.walks.get(key)
+        if walk is None or disk:
+            walk = {"files": [], "names": {}}
+            if self.isCatalogued(folder) and not disk:
+                folders = self.catalog.walk(folder)
+            else:
+                folders = os.walk(folder, topdown=False)
+            with profiling.stage("folder walk"):
+                for root, dirs, files in folders:
+                    root = os.path.normpath(os.path.abspath(root))
+                    listing = {name.lower(): os.path.join(root, name) for name in files + dirs}
+                    if disk:
+                        self.listings[os.path.normcase(root)] = listing
+                    else:
+                        self.listings.setdefault(os.path.normcase(root), listing)
+                    self.listed += 1
+                    profiling.count("directory listings")
+                    for file in files:
+                        path = os.path.join(root, file)
+                        walk["files"].append((file.lower(), path))
+                        walk["names"].setdefault(file.lower(), path)
+            self.walks[key] = walk
+        return walk
+
+    def findFile(self, folder, file_name=None, extension=None):
+        """Find a file below folder by name, or the first one with extension."""
+        query = (os.path.normcase(os.path.normpath(os.path.abspath(folder))), file_name, extension)
+        if query in self.results:
+            return self.results[query]
+        result = self.searchWalk(self.walkFolder(folder), file_name, extension)
+        key = ("walk", query[0])
+        if result is None and key not in self.refreshed and self.isCatalogued(folder):
+            # the file may have been added after the catalog was indexed
+            self.refreshed.add(key)
+            result = self.searchWalk(self.walkFolder(folder, disk=True), file_name, extension)
+            # earlier misses were answered from the catalog
+            self.results = {query: path for query, path in self.results.items() if path is not None}
+        self.results[query] = result
+        return result
+
+    def searchWalk(self, walk, file_name=None, extension=None):
+        result = None
+        if extension:
+            extension = extension.lower()
+            result = next((path for name, path in walk["files"] if name.endswith(extension)), None)
+        elif file_name:
+            file_name = file_name.lower()
+            result = walk["names"].get(file_name)
+            if result is None:
+                result = next((path for name, path in walk["files"] if name.endswith(file_name)), None)
+        return result
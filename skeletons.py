@@ -0,0 +1,89 @@
+from . import registry
+from . import sources
+
+import bpy
+import os
+
+# custom property of armature objects, content hash of the .skel they were built from
+PROPERTY = "gta_skeleton"
+
+# (path, content hash) -> parsed .skel file
+_parsed = {}
+# content hash -> armature object name
+_armatures = registry.Registry("objects", PROPERTY, lambda obj: obj.type == 'ARMATURE')
+# content hash -> bone names in bone index order
+_bones = {}
+
+
+def getHash(filepath):
+    """Content hash of a .skel file, files are only read again when they change."""
+    return sources.getHash(filepath)
+
+
+def getParsed(filepath, read):
+    """Return the parsed skeleton of filepath, read(filepath) parses it on a miss."""
+    path = os.path.normpath(os.path.abspath(filepath))
+    key = (path, getHash(filepath))
+    if key not in _parsed:
+        parser = read(filepath)
+        if not parser:
+            return None
+        # only the current version of a file is kept
+        for old_key in [old_key for old_key in _parsed if old_key[0] == path]:
+            del _parsed[old_key]
+        _parsed[key] = parser
+    return _parsed[key]
+
+
+def registerArmature(obj, filepath, bone_names):
+    skel_hash = getHash(filepath)
+    _armatures.register(obj, skel_hash)
+    _bones[skel_hash] = list(bone_names)
+
+
+def isArmatureOf(obj, skel_hash):
+    return _armatures.isRegistered(obj, skel_hash)
+
+
+def findArmature(filepath, selection=None):
+    """Return the armature built from the .skel at filepath, or None.
+
+    A selected armature wins, an armature without the property is matched by
+    name only if it is selected, like before.
+    """
+    skel_hash = getHash(filepath)
+    skel_name = os.path.basename(filepath).split(".")[0]
+    for obj in selection or []:
+        if isArmatureOf(obj, skel_hash):
+            return obj
+    for obj in selection or []:
+        if obj.type == 'ARMATURE' and PROPERTY not in obj and skel_name in obj.name:
+            return obj
+    return _armatures.find(skel_hash)
+
+
+def getBoneMapping(obj):
+    """Bone names of an armature in bone index order."""
+    skel_hash = obj.get(PROPERTY)
+    if skel_hash in _bones and len(_bones[skel_hash]) == len(obj.pose.bones):
+        return list(_bones[skel_hash])
+    bone_names = [bone.name for bone in obj.pose.bones]
+    if skel_hash:
+        _bones[skel_hash] = bone_names
+    return list(bone_names)
+
+
+def getBoneIndices(obj):
+    return {name: index for index, name in enumerate(getBoneMapping(obj))}
+
+
+def clear():
+    _armatures.clear()
+    _parsed.clear()
+    _bones.clear()
+
+
+@bpy.app.handlers.persistent
+def onLoadPost(*args):
+    # object names of the previous file mean nothing in the new one
+    clear()
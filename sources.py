@@ -0,0 +1,101 @@
+import bpy
+import hashlib
+import json
+import os
+
+# custom property of imported objects, json with the files they were built from
+PROPERTY = "gta_source"
+# custom property of mesh data, ShaderIndex of every material slot
+SLOTS_PROPERTY = "gta_shader_slots"
+
+# import options needed to build an object again
+OPTIONS = ("LOD", "import_armature", "create_materials", "texture_format", "max_influences",
+           "normalize_weights", "weld_vertices", "parser_engine", "unique_meshes", "name", "folder", "texture_folder")
+
+# (path, size, mtime) -> content hash
+_hashes = {}
+
+
+def getPath(filepath):
+    return os.path.normpath(os.path.abspath(filepath))
+
+
+def getHash(filepath):
+    """Content hash of a file, files are only read again when they change."""
+    path = getPath(filepath)
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    if key not in _hashes:
+        with open(path, 'rb') as file:
+            content_hash = hashlib.sha1(file.read()).hexdigest()
+        for old_key in [old_key for old_key in _hashes if old_key[0] == path]:
+            del _hashes[old_key]
+        _hashes[key] = content_hash
+    return _hashes[key]
+
+
+def getStamp(filepath):
+    stat = os.stat(filepath)
+    return [stat.st_size, stat.st_mtime_ns, getHash(filepath)]
+
+
+def getImagePaths(obj):
+    paths = []
+    for slot in obj.material_slots:
+        if slot.material and slot.material.node_tree:
+            for node in slot.material.node_tree.nodes:
+                if node.type == 'TEX_IMAGE' and node.image and node.image.source == 'FILE':
+                    path = bpy.path.abspath(node.image.filepath)
+                    if path not in paths:
+                        paths.append(path)
+    return paths
+
+
+def record(obj, files, **info):
+    """Remember the files obj was built from, with their content hashes."""
+    info["files"] = {}
+    for path in files:
+        if path and os.path.exists(path):
+            info["files"][getPath(path)] = getStamp(path)
+    obj[PROPERTY] = json.dumps(info)
+
+
+def recordMesh(obj, mesh_path, odr_path, **kwargs):
+    options = {option: kwargs[option] for option in OPTIONS if option in kwargs}
+    record(obj, [mesh_path, odr_path] + getImagePaths(obj), type="mesh", mesh=getPath(mesh_path),
+           odr=getPath(odr_path) if odr_path else None, options=options)
+
+
+def recordSkeleton(obj, skel_path):
+    record(obj, [skel_path], type="skeleton", skeleton=getPath(skel_path))
+
+
+def store(obj, source):
+    obj[PROPERTY] = json.dumps(source)
+
+
+def getSource(obj):
+    source = obj.get(PROPERTY)
+    return json.loads(source) if source else None
+
+
+def getChanged(source):
+    """Paths of the source files whose content changed or that are gone.
+
+    Files with the recorded size and mtime are not read, touched files with
+    the same content get their new stamp in source.
+    """
+    changed = set()
+    for path, (size, mtime, content_hash) in source["files"].items():
+        try:
+            stat = os.stat(path)
+        except OSError:
+            changed.add(path)
+            continue
+        if (stat.st_size, stat.st_mtime_ns) == (size, mtime):
+            continue
+        if getHash(path) != content_hash:
+            changed.add(path)
+        else:
+            source["files"][path] = getStamp(path)
+    return changed